@@ -0,0 +1,154 @@
+# Steps many games at once. Boards are bitboard rows (see board.py) stacked into one (N, GRID_HEIGHT) array.
+
+import numpy as np
+
+from board import GRID_WIDTH, GRID_HEIGHT, FULL_ROW
+from engine import SCORE_FACTORS, LINES_PER_LEVEL, SPAWN_X
+from tetromino import SHAPES
+
+NUM_PREVIEWS = 5
+BAGS_PER_REFILL = 8
+
+NUM_ROTATIONS = np.array([shape.num_rotations() for shape in SHAPES])
+# Piece tables indexed by [shape, rotation]. Row masks are normalized so the leftmost cell is bit 0.
+PIECE_MASKS = np.zeros((len(SHAPES), 4, 4), dtype=np.int32)
+PIECE_LEFT = np.zeros((len(SHAPES), 4), dtype=np.int32)
+PIECE_RIGHT = np.zeros((len(SHAPES), 4), dtype=np.int32)
+# Lowest filled row of each normalized column, -1 for empty columns.
+PIECE_BOTTOM = np.full((len(SHAPES), 4, 4), -1, dtype=np.int32)
+for _shape in SHAPES:
+    for _r, _info in enumerate(_shape.rotations):
+        PIECE_LEFT[_shape.index, _r] = _info.left
+        PIECE_RIGHT[_shape.index, _r] = _info.right
+        for _dy, _mask in _info.row_masks:
+            PIECE_MASKS[_shape.index, _r, _dy] = _mask
+        for _dx, _bottom, _ in _info.column_profile:
+            PIECE_BOTTOM[_shape.index, _r, _dx] = _bottom
+
+COLUMN_BITS = 1 << np.arange(GRID_WIDTH)
+ROW_INDEXES = np.arange(GRID_HEIGHT)
+PIECE_OFFSETS = np.arange(4)
+
+
+def expand_cells(rows):
+    # (..., GRID_HEIGHT) rows -> (..., GRID_HEIGHT, GRID_WIDTH) booleans.
+    return (rows[..., None] & COLUMN_BITS) != 0
+
+
+def column_heights(rows):
+    cells = expand_cells(rows)
+    occupied = cells.any(axis=-2)
+    return np.where(occupied, GRID_HEIGHT - cells.argmax(axis=-2), 0)
+
+
+def count_holes(rows, heights=None):
+    if heights is None:
+        heights = column_heights(rows)
+    return heights.sum(axis=-1) - expand_cells(rows).sum(axis=(-2, -1))
+
+
+def calculate_bumpiness(heights):
+    return np.abs(np.diff(heights, axis=-1)).sum(axis=-1)
+
+
+def clear_full_rows(rows):
+    # Returns rows with full lines removed and the number of lines cleared per board.
+    full = rows == FULL_ROW
+    lines_cleared = full.sum(axis=-1)
+    if not lines_cleared.any():
+        return rows, lines_cleared
+    # Stable sort moves full rows to the top while keeping the others in order.
+    order = np.argsort(~full, axis=-1, kind="stable")
+    rows = np.take_along_axis(rows, order, axis=-1)
+    rows[ROW_INDEXES < lines_cleared[..., None]] = 0
+    return rows, lines_cleared
+
+
+class BatchTetris:
+    def __init__(self, num_games, training_mode=False, seed=None):
+        self.num_games = num_games
+        self.training_mode = training_mode
+        self.rng = np.random.default_rng(seed)
+        self.game_indexes = np.arange(num_games)
+
+        self.boards = np.zeros((num_games, GRID_HEIGHT), dtype=np.int32)
+        self.score = np.zeros(num_games, dtype=np.int64)
+        self.total_lines_cleared = np.zeros(num_games, dtype=np.int64)
+        self.level = np.ones(num_games, dtype=np.int64)
+        self.pieces = np.zeros(num_games, dtype=np.int64)
+        self.rounds = 0
+
+        self.sequence = np.empty((num_games, 0), dtype=np.int8)
+        self.position = 0
+        self.refill_sequence()
+
+    def refill_sequence(self):
+        bags = np.tile(np.arange(len(SHAPES), dtype=np.int8), (self.num_games, BAGS_PER_REFILL, 1))
+        bags = self.rng.permuted(bags, axis=-1).reshape(self.num_games, -1)
+        self.sequence = np.concatenate([self.sequence[:, self.position :], bags], axis=1)
+        self.position = 0
+
+    @property
+    def current(self):
+        return self.sequence[:, self.position]
+
+    @property
+    def next_shapes(self):
+        return self.sequence[:, self.position + 1 : self.position + 1 + NUM_PREVIEWS]
+
+    def column_heights(self):
+        return column_heights(self.boards)
+
+    def fits_at_spawn(self, shapes):
+        masks = PIECE_MASKS[shapes, 0] << (SPAWN_X + PIECE_LEFT[shapes, 0])[:, None]
+        return ~(self.boards[:, :4] & masks).any(axis=1)
+
+    def landing_rows(self, shapes, rotations, x):
+        heights = self.column_heights()
+        columns = (x + PIECE_LEFT[shapes, rotations])[:, None] + PIECE_OFFSETS
+        bottom = PIECE_BOTTOM[shapes, rotations]
+        tops = GRID_HEIGHT - np.take_along_axis(heights, np.minimum(columns, GRID_WIDTH - 1), axis=1)
+        return np.where(bottom >= 0, tops - 1 - bottom, GRID_HEIGHT).min(axis=1)
+
+    def step(self, rotations, columns):
+        shapes = self.current
+        rotations = np.asarray(rotations) % NUM_ROTATIONS[shapes]
+        left = PIECE_LEFT[shapes, rotations]
+        right = PIECE_RIGHT[shapes, rotations]
+        # Walls stop horizontal moves, like move_h does.
+        x = np.clip(columns, -left, GRID_WIDTH - 1 - right)
+        y = self.landing_rows(shapes, rotations, x)
+
+        # Lock.
+        masks = PIECE_MASKS[shapes, rotations] << (x + left)[:, None]
+        rows = y[:, None] + PIECE_OFFSETS
+        filled = masks != 0
+        overflow = (filled & (rows < 0)).any(axis=1)
+        stamp = filled & (rows >= 0)
+        games = np.broadcast_to(self.game_indexes[:, None], rows.shape)
+        self.boards[games[stamp], rows[stamp]] |= masks[stamp]
+
+        self.boards, lines_cleared = clear_full_rows(self.boards)
+        score_earned = np.take(SCORE_FACTORS, lines_cleared) * self.level
+        self.score += score_earned
+        self.total_lines_cleared += lines_cleared
+        self.pieces += 1
+        if not self.training_mode:
+            self.level = self.total_lines_cleared // LINES_PER_LEVEL + 1
+
+        self.position += 1
+        if self.position + NUM_PREVIEWS >= self.sequence.shape[1]:
+            self.refill_sequence()
+
+        dones = overflow | ~self.fits_at_spawn(self.current)
+        if dones.any():
+            self.reset_games(dones)
+        return score_earned, lines_cleared, dones
+
+    def reset_games(self, dones):
+        self.rounds += int(dones.sum())
+        self.boards[dones] = 0
+        self.score[dones] = 0
+        self.total_lines_cleared[dones] = 0
+        self.level[dones] = 1
+        self.pieces[dones] = 0
@@ -0,0 +1,266 @@
+# Benchmarks for engine, search and screen parsing hot paths.
+#
+#   python benchmark.py --output bench.json
+#   python benchmark.py --save-baseline              # store results as the new baseline
+#   python benchmark.py --screenshots captures/      # also time tetr.io frame parsing
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+from board import Board, FULL_ROW, GRID_HEIGHT
+from engine import TetrisEngine
+from evaluator import best_placement
+from movegen import reachable_placements
+from search import beam_search, placements
+from search_player import find_lowest_cost
+from tetromino import SHAPES, Tetromino
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+DEFAULT_TOLERANCE = 0.25
+SEED = 1234
+
+# fmt: off
+# Bottom rows of each fixture; rows above are empty.
+BOARD_FIXTURES = {
+    "empty": [],
+    "flat": [
+        "XXXXXXXX.X",
+        "XXXXXXX.XX",
+        "XX.XXXXXXX",
+    ],
+    "ragged": [
+        "X.........",
+        "XX......X.",
+        "XX.X...XX.",
+        "XXXX.X.XXX",
+        "XXXXXX.XXX",
+        "X.XXXXXXXX",
+        "XXX.XXXXXX",
+        "XXXXXXXX.X",
+    ],
+    "tall": [
+        "XX........",
+        "XXX.....XX",
+        "XXXX...XXX",
+        "XXXX.XXXXX",
+        "XXXX.XXXXX",
+        "XXXXXX.XXX",
+        "XXX.XXXXXX",
+        "XXXXXX.XXX",
+        "XX.XXXXXXX",
+        "XXXXX.XXXX",
+        "XXXXXXXX.X",
+        "XXXXXXX.XX",
+        "X.XXXXXXXX",
+        "XXXX.XXXXX",
+    ],
+}
+# fmt: on
+
+
+def fixture_board(name):
+    lines = BOARD_FIXTURES[name]
+    rows = [0] * (GRID_HEIGHT - len(lines))
+    for line in lines:
+        rows.append(sum(1 << x for x, c in enumerate(line) if c == "X"))
+    return Board(rows, track_colors=False)
+
+
+def seeded_engine():
+    return TetrisEngine(training_mode=True, seed=SEED)
+
+
+def measure(fn, ops, min_time=0.2):
+    # Returns seconds per op, the best of several rounds of at least min_time each.
+    fn()
+    best = None
+    for _ in range(3):
+        rounds = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            rounds += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        per_op = elapsed / (rounds * ops)
+        best = per_op if best is None else min(best, per_op)
+    return best
+
+
+def bench_candidates(board):
+    def run():
+        for shape in SHAPES:
+            for _ in placements(board, shape):
+                pass
+
+    ops = sum(1 for shape in SHAPES for _ in placements(board, shape))
+    return run, ops
+
+
+def bench_estimate_cost(board):
+    game = TetrisEngine(training_mode=True)
+    game.board = board
+    candidates = [Tetromino(x, y, shape, r) for shape in SHAPES for r, _, x, y in placements(board, shape)]
+
+    def run():
+        for tetromino in candidates:
+            game.estimate_cost(tetromino)
+
+    return run, len(candidates)
+
+
+def bench_best_placement(board):
+    def run():
+        for shape in SHAPES:
+            best_placement(board, shape)
+
+    return run, len(SHAPES)
+
+
+def bench_reachable(board):
+    def run():
+        for shape in SHAPES:
+            reachable_placements(board, shape)
+
+    return run, len(SHAPES)
+
+
+def bench_clear_lines(board):
+    # Complete every non-empty row so they all clear.
+    rows = [FULL_ROW if row else 0 for row in board.rows]
+    full = Board(rows, track_colors=False)
+
+    def run():
+        full.copy().clear_lines()
+
+    return run, 1
+
+
+def bench_step(pieces):
+    def run():
+        game = seeded_engine()
+        for _ in range(pieces):
+            rotate, column = find_lowest_cost(game)
+            game.step(rotate, column)
+
+    return run, pieces
+
+
+def bench_search(pieces, depth, beam_width):
+    def run():
+        game = seeded_engine()
+        for _ in range(pieces):
+            shapes = [game.falling.shape] + [t.shape for t in game.next_tetrominos]
+            result = beam_search(game.board, shapes, None, depth, beam_width, use_hold=False)
+            game.step(result.rotation, result.x)
+
+    return run, pieces
+
+
+def bench_frame_parsing(directory):
+    import numpy as np
+    from PIL import Image
+
+    import tetrio
+
+    # Parsers take BGR(A) frames like the ones mss captures.
+    paths = sorted(glob.glob(os.path.join(directory, "*.png")))
+    screenshots = [np.asarray(Image.open(path).convert("RGB"))[:, :, ::-1] for path in paths]
+    if not screenshots:
+        return {}
+
+    def parse_boards():
+        for screenshot in screenshots:
+            tetrio.parse_board(screenshot)
+
+    def parse_pieces():
+        for screenshot in screenshots:
+            tetrio.parse_pieces(screenshot)
+
+    return {
+        "frame_parse_board": (parse_boards, len(screenshots)),
+        "frame_parse_pieces": (parse_pieces, len(screenshots)),
+    }
+
+
+def collect_benchmarks(args):
+    benchmarks = {}
+    for name in BOARD_FIXTURES:
+        board = fixture_board(name)
+        benchmarks[f"candidates_{name}"] = bench_candidates(board)
+        benchmarks[f"estimate_cost_{name}"] = bench_estimate_cost(board)
+        benchmarks[f"best_placement_{name}"] = bench_best_placement(board)
+        benchmarks[f"reachable_{name}"] = bench_reachable(board)
+        benchmarks[f"clear_lines_{name}"] = bench_clear_lines(board)
+    benchmarks["step_greedy"] = bench_step(args.pieces)
+    benchmarks["search_depth3"] = bench_search(args.search_pieces, 3, 16)
+    if args.screenshots:
+        benchmarks.update(bench_frame_parsing(args.screenshots))
+    return benchmarks
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["seconds_per_op"] / baseline[name]["seconds_per_op"]
+        result["baseline_ratio"] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark engine, search and frame parsing.")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with these results")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown ratio")
+    parser.add_argument("--screenshots", help="directory of saved tetr.io captures (*.png)")
+    parser.add_argument("--pieces", type=int, default=200, help="pieces per step() run")
+    parser.add_argument("--search-pieces", type=int, default=20, help="pieces per search run")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (fn, ops) in collect_benchmarks(args).items():
+        if args.filter not in name:
+            continue
+        per_op = measure(fn, ops)
+        results[name] = {"seconds_per_op": per_op, "ops_per_sec": 1 / per_op}
+        print(f"{name:28} {per_op * 1e6:12.2f} us/op", file=sys.stderr)
+
+    regressions = []
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+        "regressions": regressions,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+    for name in regressions:
+        print(f"Regression: {name} is {results[name]['baseline_ratio']:.2f}x the baseline", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# Bitboard - each row is an int, bit x set means column x is occupied.
+
+from collections import namedtuple
+
+GRID_WIDTH = 10
+GRID_HEIGHT = 20
+FULL_ROW = (1 << GRID_WIDTH) - 1
+
+
+COLUMN_FULL = (1 << GRID_HEIGHT) - 1
+
+BoardStats = namedtuple("BoardStats", ["lines_cleared", "aggregate_height", "holes", "bumpiness"])
+
+
+def column_stats(columns):
+    heights = [column.bit_length() for column in columns]
+    holes = sum(height - column.bit_count() for height, column in zip(heights, columns))
+    bumpiness = sum(abs(heights[i] - heights[i - 1]) for i in range(1, GRID_WIDTH))
+    return heights, holes, bumpiness
+
+
+def remove_rows(columns, cleared):
+    # Cleared rows must be in ascending y so lower bits are not shifted before they are removed.
+    for y in cleared:
+        bit = GRID_HEIGHT - 1 - y
+        low = (1 << bit) - 1
+        columns = [(column & low) | (column >> (bit + 1) << bit) for column in columns]
+    return columns
+
+
+class Board:
+    def __init__(self, rows=None, colors=None, track_colors=True):
+        self.rows = list(rows) if rows else [0] * GRID_HEIGHT
+        # Color plane is only needed for rendering; search copies skip it.
+        if colors is not None:
+            self.colors = [list(row) for row in colors]
+        elif track_colors:
+            self.colors = [[None] * GRID_WIDTH for _ in range(GRID_HEIGHT)]
+        else:
+            self.colors = None
+        self.rebuild_stats()
+
+    def rebuild_stats(self):
+        # Column bitmasks (bit 0 is the bottom row) make heights and holes popcounts.
+        self.columns = [0] * GRID_WIDTH
+        for y, row in enumerate(self.rows):
+            bit = 1 << (GRID_HEIGHT - 1 - y)
+            for x in range(GRID_WIDTH):
+                if row >> x & 1:
+                    self.columns[x] |= bit
+        self.update_column_stats()
+
+    def update_column_stats(self):
+        self.heights = [column.bit_length() for column in self.columns]
+        self.column_holes = [height - column.bit_count() for height, column in zip(self.heights, self.columns)]
+        self.holes = sum(self.column_holes)
+        self.aggregate_height = sum(self.heights)
+        self.bumpiness = sum(abs(self.heights[i] - self.heights[i - 1]) for i in range(1, GRID_WIDTH))
+
+    @classmethod
+    def from_positions(cls, positions):
+        rows = [0] * GRID_HEIGHT
+        colors = [[None] * GRID_WIDTH for _ in range(GRID_HEIGHT)]
+        for (x, y), color in positions.items():
+            if 0 <= y < GRID_HEIGHT:
+                rows[y] |= 1 << x
+                colors[y][x] = color
+        return cls(rows, colors)
+
+    def copy(self, with_colors=False):
+        board = Board.__new__(Board)
+        board.rows = list(self.rows)
+        board.colors = [list(row) for row in self.colors] if with_colors and self.colors is not None else None
+        board.columns = list(self.columns)
+        board.heights = list(self.heights)
+        board.column_holes = list(self.column_holes)
+        board.holes = self.holes
+        board.aggregate_height = self.aggregate_height
+        board.bumpiness = self.bumpiness
+        return board
+
+    @property
+    def stats(self):
+        return BoardStats(0, self.aggregate_height, self.holes, self.bumpiness)
+
+    def is_occupied(self, x, y):
+        return bool(self.rows[y] >> x & 1)
+
+    def color_at(self, x, y):
+        if self.colors is None:
+            return None
+        return self.colors[y][x]
+
+    def fits(self, rotation_info, x, y):
+        if x + rotation_info.left < 0 or x + rotation_info.right >= GRID_WIDTH:
+            return False
+        shift = x + rotation_info.left
+        rows = self.rows
+        for dy, mask in rotation_info.row_masks:
+            row = y + dy
+            if row >= GRID_HEIGHT:
+                return False
+            # Rows above the top are always free.
+            if row >= 0 and rows[row] & (mask << shift):
+                return False
+        return True
+
+    def drop_y(self, rotation_info, x):
+        # Landing row for a piece dropped straight down from above the stack.
+        shift = x + rotation_info.left
+        heights = self.heights
+        return min(GRID_HEIGHT - 1 - heights[shift + dx] - bottom for dx, bottom, _ in rotation_info.column_profile)
+
+    def landing_y(self, rotation_info, x, y):
+        # Where a piece at (x, y) comes to rest when dropped, even from under an overhang.
+        shift = x + rotation_info.left
+        heights = self.heights
+        if all(y + bottom < GRID_HEIGHT - heights[shift + dx] for dx, bottom, _ in rotation_info.column_profile):
+            # Above the stack in every column, so it lands where drop_y says.
+            return self.drop_y(rotation_info, x)
+        while self.fits(rotation_info, x, y + 1):
+            y += 1
+        return y
+
+    def piece_columns(self, rotation_info, x, y):
+        # Yields (column, column bits after placing) for each column the piece covers.
+        shift = x + rotation_info.left
+        columns = self.columns
+        for dx, bottom, top in rotation_info.column_profile:
+            # Cells above the top row fall outside COLUMN_FULL and are not stamped.
+            mask = ((1 << (bottom - top + 1)) - 1) << (GRID_HEIGHT - 1 - y - bottom) & COLUMN_FULL
+            yield shift + dx, columns[shift + dx] | mask
+
+    def full_rows_after(self, rotation_info, x, y):
+        shift = x + rotation_info.left
+        rows = self.rows
+        return [
+            y + dy for dy, mask in rotation_info.row_masks if 0 <= y + dy and rows[y + dy] | (mask << shift) == FULL_ROW
+        ]
+
+    def stats_after(self, rotation_info, x, y):
+        # Stats for a hypothetical placement, without copying or rescanning the board.
+        full_rows = self.full_rows_after(rotation_info, x, y)
+        if full_rows:
+            columns = list(self.columns)
+            for column, bits in self.piece_columns(rotation_info, x, y):
+                columns[column] = bits
+            heights, holes, bumpiness = column_stats(remove_rows(columns, full_rows))
+            return BoardStats(len(full_rows), sum(heights), holes, bumpiness)
+
+        heights = self.heights
+        new_heights = {}
+        holes = self.holes
+        for column, bits in self.piece_columns(rotation_info, x, y):
+            height = bits.bit_length()
+            new_heights[column] = height
+            holes += height - bits.bit_count() - self.column_holes[column]
+        aggregate_height = self.aggregate_height + sum(new_heights.values()) - sum(heights[c] for c in new_heights)
+        # Only the gaps next to covered columns change.
+        bumpiness = self.bumpiness
+        for i in range(max(1, min(new_heights)), min(GRID_WIDTH, max(new_heights) + 2)):
+            left, right = heights[i - 1], heights[i]
+            bumpiness += abs(new_heights.get(i, right) - new_heights.get(i - 1, left)) - abs(right - left)
+        return BoardStats(0, aggregate_height, holes, bumpiness)
+
+    def placement_delta(self, rotation_info, x, y):
+        after = self.stats_after(rotation_info, x, y)
+        return BoardStats(
+            after.lines_cleared,
+            after.aggregate_height - self.aggregate_height,
+            after.holes - self.holes,
+            after.bumpiness - self.bumpiness,
+        )
+
+    def place(self, rotation_info, x, y, color=None):
+        shift = x + rotation_info.left
+        heights = self.heights
+        for column, bits in self.piece_columns(rotation_info, x, y):
+            height = bits.bit_length()
+            holes = height - bits.bit_count()
+            self.aggregate_height += height - heights[column]
+            self.holes += holes - self.column_holes[column]
+            for neighbor in (column - 1, column + 1):
+                if 0 <= neighbor < GRID_WIDTH:
+                    self.bumpiness += abs(height - heights[neighbor]) - abs(heights[column] - heights[neighbor])
+            self.columns[column] = bits
+            heights[column] = height
+            self.column_holes[column] = holes
+        for dy, mask in rotation_info.row_masks:
+            row = y + dy
+            if row < 0:
+                continue
+            bits = mask << shift
+            self.rows[row] |= bits
+            if self.colors is not None:
+                colors = self.colors[row]
+                while bits:
+                    low = bits & -bits
+                    colors[low.bit_length() - 1] = color
+                    bits ^= low
+
+    def clear_lines(self):
+        if FULL_ROW not in self.rows:
+            return 0
+        full_rows = [i for i, row in enumerate(self.rows) if row == FULL_ROW]
+        kept = [i for i, row in enumerate(self.rows) if row != FULL_ROW]
+        lines_cleared = len(full_rows)
+        self.rows = [0] * lines_cleared + [self.rows[i] for i in kept]
+        if self.colors is not None:
+            self.colors = [[None] * GRID_WIDTH for _ in range(lines_cleared)] + [self.colors[i] for i in kept]
+
+        self.columns = remove_rows(self.columns, full_rows)
+        self.update_column_stats()
+        return lines_cleared
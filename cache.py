@@ -0,0 +1,71 @@
+# Bounded LRU cache for board evaluations and search results.
+
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# Approximate memory per entry, measured with tracemalloc over self-play boards: ENTRY_BYTES for the key and
+# bookkeeping, plus ITEM_BYTES per (cost, rotation, x, y) tuple when the value is a placement list.
+# Placement lists average about 23 items, so a typical entry is around 2.4 KB.
+ENTRY_BYTES = 200
+ITEM_BYTES = 95
+
+
+def entry_size(value):
+    return ENTRY_BYTES + ITEM_BYTES * len(value) if isinstance(value, list) else ENTRY_BYTES
+
+
+class TranspositionTable:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        # Entries are evicted least recently used first once their approximate size passes max_bytes.
+        self.max_bytes = max_bytes
+        # key -> (value, size)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        try:
+            value, _ = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        old = self.entries.get(key)
+        if old is not None:
+            self.bytes -= old[1]
+        size = entry_size(value)
+        self.entries[key] = (value, size)
+        self.entries.move_to_end(key)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
@@ -0,0 +1,331 @@
+# Rules engine without any pygame dependency - safe to run headless.
+
+from board import Board
+from cache import TranspositionTable
+from evaluator import best_placement
+from movegen import LEFT, RIGHT, ROTATE, ROTATE_CCW, SONIC_DROP, reachable_placements
+from rollout import DEFAULT_CANDIDATES, DEFAULT_HORIZON, DEFAULT_SAMPLES, rollout_action
+from search import DEFAULT_BEAM_WIDTH, DEFAULT_DEPTH, DEFAULT_WEIGHTS, anytime_search, beam_search, board_cost
+from tetromino import SHAPES, SPAWN_X, Shape7Bag, Tetromino
+
+SCORE_FACTORS = [0, 40, 100, 300, 1200]
+LINES_PER_LEVEL = 10
+
+
+class TetrisEngine:
+    def __init__(
+        self,
+        training_mode=False,
+        mirror_mode=False,
+        table=None,
+        seed=None,
+        recorder=None,
+        weights=DEFAULT_WEIGHTS,
+        auto_restart=True,
+        surfaces=None,
+    ):
+        self.training_mode = training_mode
+        self.mirror_mode = mirror_mode
+        # When False, a game over leaves the final board in place until reset() is called.
+        self.auto_restart = auto_restart
+        # Cost weights per BoardStats feature, see search.board_cost.
+        self.weights = weights
+        self.bag = Shape7Bag(seed)
+        # A replay.ReplayWriter that gets one record per locked piece.
+        self.recorder = recorder
+        # Kept across games so lookahead reuses evaluations from earlier pieces.
+        self.table = table if table is not None else TranspositionTable()
+        # A surfaces.SurfaceTable consulted by get_best_action before scoring placements.
+        self.surfaces = surfaces
+        # Pieces deep the last lookahead got; less than asked for if its budget ran out.
+        self.search_depth = 0
+
+        self.rounds = 0
+        self.record_level = 0
+        self.record_lines = 0
+        self.record_score = 0
+        self.reset()
+
+    def reset(self):
+        self.fall_speed = 500
+        self.board = Board()
+        self.score = 0
+        self.total_lines_cleared = 0
+        self.level = 1
+        self.falling = None if self.mirror_mode else Tetromino(SPAWN_X, -1, self.bag.next())
+        self.next_tetrominos = [] if self.mirror_mode else self.get_next_tetrominos(5)
+        self.held = None
+        # Cost of the last chosen action, logged by the recorder.
+        self.action_cost = None
+        # Outcome of the last locked piece.
+        self.reward = 0
+        self.last_lines_cleared = 0
+        self.game_over = False
+
+        # Useful for training
+        self.holes = 0
+        self.bumpiness = 0
+
+    def valid_move(self):
+        return self.is_valid_position(self.falling)
+
+    def is_valid_position(self, tetromino: Tetromino):
+        return self.board.fits(tetromino.rotation_info, tetromino.x, tetromino.y)
+
+    def move_h(self, direction):
+        self.falling.x += direction
+        if not self.valid_move():
+            self.falling.x -= direction
+
+    def move_down(self):
+        self.falling.y += 1
+        if not self.valid_move():
+            self.falling.y -= 1
+            return False
+        return True
+
+    def rotate(self):
+        self.falling.rotate()
+        if not self.valid_move():
+            self.falling.unrotate()
+
+    def rotate_ccw(self):
+        self.falling.unrotate()
+        if not self.valid_move():
+            self.falling.rotate()
+
+    def hold(self):
+        if self.held is None:
+            self.held = Tetromino(SPAWN_X, 0, self.falling.shape)
+            self.rotate_upcoming()
+        else:
+            self.falling, self.held = Tetromino(SPAWN_X, 0, self.held.shape), Tetromino(SPAWN_X, 0, self.falling.shape)
+
+    def apply_moves(self, moves, hold=False):
+        # Plays a movegen sequence, then hard drops.
+        if hold:
+            self.hold()
+        for move in moves:
+            if move == LEFT:
+                self.move_h(-1)
+            elif move == RIGHT:
+                self.move_h(1)
+            elif move == ROTATE:
+                self.rotate()
+            elif move == ROTATE_CCW:
+                self.rotate_ccw()
+            elif move == SONIC_DROP:
+                while self.move_down():
+                    pass
+        self.hard_drop()
+
+    def hard_drop(self):
+        falling = self.falling
+        falling.y = self.board.landing_y(falling.rotation_info, falling.x, falling.y)
+        self.complete_fall()
+
+    def clear_lines(self):
+        return self.board.clear_lines()
+
+    def complete_fall(self):
+        falling = self.falling
+        state = list(self.board.rows) if self.recorder else None
+        self.board.place(falling.rotation_info, falling.x, falling.y, falling.shape.color)
+
+        lines_cleared = self.clear_lines()
+        self.last_lines_cleared = lines_cleared
+        score_earned = SCORE_FACTORS[lines_cleared] * self.level
+        self.score += score_earned
+
+        self.total_lines_cleared += lines_cleared
+        # Increase level/speed.
+        self.level = 1 if self.training_mode else self.total_lines_cleared // LINES_PER_LEVEL + 1
+
+        orig_holes = self.holes
+        orig_bumpiness = self.bumpiness
+        self.count_holes()
+        self.calculate_bumpiness()
+        increased_holes = self.holes - orig_holes
+        increased_bumpiness = self.bumpiness - orig_bumpiness
+        self.reward = score_earned - (increased_holes * 2) - (increased_bumpiness - 3)
+
+        if self.recorder:
+            self.recorder.record(
+                state,
+                falling.shape.index,
+                falling.rotation,
+                falling.x,
+                lines_cleared,
+                self.action_cost,
+                self.reward,
+                self.rounds,
+            )
+        self.action_cost = None
+
+        # After recording, since the locked piece is reused for the preview.
+        self.rotate_upcoming()
+
+        self.fall_speed = 500 / (1 + (self.level - 1) * 0.2)
+
+        # Still set after an automatic restart, until the next piece locks.
+        game_over = not self.valid_move()
+        if game_over and self.auto_restart:
+            self.update_records_and_restart()
+        self.game_over = game_over
+
+    def get_next_tetrominos(self, num):
+        return [Tetromino(SPAWN_X, 0, SHAPES[i]) for i in self.bag.generate(num)]
+
+    def rotate_upcoming(self):
+        # The piece that just locked is reused for the new last preview.
+        locked = self.falling
+        self.falling = self.next_tetrominos.pop(0)
+        if locked is None or self.mirror_mode:
+            self.next_tetrominos.extend(self.get_next_tetrominos(1))
+        else:
+            locked.respawn(SPAWN_X, 0, self.bag.next())
+            self.next_tetrominos.append(locked)
+
+    def update_records_and_restart(self):
+        self.rounds += 1
+        self.record_level = max(self.record_level, self.level)
+        self.record_lines = max(self.record_lines, self.total_lines_cleared)
+        self.record_score = max(self.record_score, self.score)
+        self.reset()
+
+    # Board keeps these up to date as pieces lock and lines clear.
+    def count_holes(self):
+        self.holes = self.board.holes
+        return self.holes
+
+    def calculate_bumpiness(self):
+        self.bumpiness = self.board.bumpiness
+        return self.bumpiness
+
+    def estimate_cost(self, tetromino: Tetromino):
+        # Line clears are accounted for without copying the board.
+        return board_cost(self.board.stats_after(tetromino.rotation_info, tetromino.x, tetromino.y), self.weights)
+
+    def surface_move(self):
+        # (rotation, x, y) from the surfaces table, or None if there is no table or the board isn't covered.
+        if self.surfaces is None:
+            return None
+        move = self.surfaces.lookup(self.board, self.falling.shape, self.weights)
+        if move is None:
+            return None
+        r, x = move
+        info = self.falling.shape.rotations[r]
+        y = self.board.drop_y(info, x)
+        self.action_cost = board_cost(self.board.stats_after(info, x, y), self.weights)
+        return r, x, y
+
+    def get_best_action(self):
+        if not self.falling:
+            print("not falling...")
+            return 0, 0
+
+        move = self.surface_move()
+        if move is not None:
+            r, x, _ = move
+            return r, x
+
+        # All rotations and columns are scored in one NumPy pass.
+        cost, best_r, best_x, _ = best_placement(self.board, self.falling.shape, self.weights)
+        self.action_cost = cost
+        return best_r, best_x
+
+    def get_best_moves(self):
+        # Like get_best_action, but over every reachable lock position including tucks and spins.
+        # Returns the moves for apply_moves.
+        falling = self.falling
+        board = self.board
+        placements = reachable_placements(board, falling.shape, falling.x, falling.y, falling.rotation)
+        best_cost, best_moves = None, ()
+        for (r, x, y), moves in placements.items():
+            cost = board_cost(board.stats_after(falling.shape.rotations[r], x, y), self.weights)
+            if best_cost is None or cost < best_cost:
+                best_cost, best_moves = cost, moves
+        self.action_cost = best_cost
+        return best_moves
+
+    def lookahead(
+        self, depth=DEFAULT_DEPTH, beam_width=DEFAULT_BEAM_WIDTH, use_hold=True, reachable=False, budget=None
+    ):
+        # With a search.SearchBudget, deepens up to depth until the budget runs out.
+        pieces = [self.falling.shape] + [t.shape for t in self.next_tetrominos]
+        held = self.held.shape if self.held else None
+        if budget is None:
+            result = beam_search(
+                self.board, pieces, held, depth, beam_width, use_hold, self.table, self.weights, reachable
+            )
+            self.search_depth = depth
+        else:
+            result, self.search_depth = anytime_search(
+                self.board, pieces, held, budget, depth, beam_width, use_hold, self.table, self.weights, reachable
+            )
+        self.action_cost = result.cost
+        return result
+
+    def get_lookahead_action(self, depth=DEFAULT_DEPTH, beam_width=DEFAULT_BEAM_WIDTH, use_hold=True, budget=None):
+        if not self.falling:
+            print("not falling...")
+            return 0, 0, False
+
+        result = self.lookahead(depth, beam_width, use_hold, budget=budget)
+        return result.rotation, result.x, result.hold
+
+    def get_lookahead_moves(self, depth=DEFAULT_DEPTH, beam_width=DEFAULT_BEAM_WIDTH, use_hold=True, budget=None):
+        # Searches every reachable placement and returns (hold, moves) for apply_moves.
+        if not self.falling:
+            print("not falling...")
+            return False, ()
+
+        result = self.lookahead(depth, beam_width, use_hold, reachable=True, budget=budget)
+        if result.hold:
+            # hold() brings the piece in at spawn.
+            shape = self.held.shape if self.held else self.next_tetrominos[0].shape
+            start = (SPAWN_X, 0, 0)
+        else:
+            shape = self.falling.shape
+            start = (self.falling.x, self.falling.y, self.falling.rotation)
+        moves = reachable_placements(self.board, shape, *start).get((result.rotation, result.x, result.y))
+        return result.hold, moves or ()
+
+    def get_rollout_action(
+        self,
+        samples=DEFAULT_SAMPLES,
+        horizon=DEFAULT_HORIZON,
+        candidates=DEFAULT_CANDIDATES,
+        executor=None,
+        seed=None,
+    ):
+        # Expected cost over bag-consistent futures past the preview, see rollout.py.
+        if not self.falling:
+            print("not falling...")
+            return 0, 0
+
+        pieces = [self.falling.shape] + [t.shape for t in self.next_tetrominos]
+        r, x, cost = rollout_action(
+            self.board, pieces, self.bag.drawn, samples, horizon, candidates, executor, seed, self.weights
+        )
+        self.action_cost = cost
+        return r, x
+
+    def step(self, rotate, column, hold=False):
+        if hold:
+            self.hold()
+
+        # Rotate.
+        for _ in range(rotate):
+            self.falling.rotate()
+
+        # Move.
+        movement = column - SPAWN_X
+        if movement != 0:
+            distance = abs(movement)
+            direction = movement // distance
+            for _ in range(distance):
+                self.move_h(direction)
+
+        # Fall.
+        self.hard_drop()
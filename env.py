@@ -0,0 +1,80 @@
+# reset()/step() environment around TetrisEngine for training agents.
+#
+#   env = TetrisEnv(seed=0)
+#   observation, info = env.reset()
+#   while True:
+#       observation, reward, done, info = env.step((rotate, column, hold))
+#
+# The observation is one preallocated uint8 array, overwritten in place on every reset() and step() -
+# copy it if you need to keep it. Its first GRID_HEIGHT * GRID_WIDTH entries are the board, 1 for occupied,
+# followed by the current piece, the preview pieces and the held piece as shape indexes (NO_PIECE if empty).
+
+import numpy as np
+
+from board import GRID_HEIGHT, GRID_WIDTH
+from engine import TetrisEngine
+from search import DEFAULT_WEIGHTS
+from tetromino import SHAPES, Shape7Bag
+
+NUM_PREVIEWS = 5
+NO_PIECE = len(SHAPES)
+BOARD_SIZE = GRID_HEIGHT * GRID_WIDTH
+OBSERVATION_SIZE = BOARD_SIZE + 1 + NUM_PREVIEWS + 1
+
+COLUMN_BITS = (1 << np.arange(GRID_WIDTH)).astype(np.uint16)
+
+
+class TetrisEnv:
+    def __init__(self, seed=None, training_mode=True, auto_restart=False, weights=DEFAULT_WEIGHTS):
+        # With auto_restart, step() starts a new game itself after reporting done.
+        self.engine = TetrisEngine(training_mode=training_mode, seed=seed, weights=weights, auto_restart=auto_restart)
+
+        self.observation = np.zeros(OBSERVATION_SIZE, dtype=np.uint8)
+        # Views into observation, so filling them in needs no new arrays.
+        self.board = self.observation[:BOARD_SIZE].reshape(GRID_HEIGHT, GRID_WIDTH)
+        self.pieces = self.observation[BOARD_SIZE:]
+        self.rows = np.zeros(GRID_HEIGHT, dtype=np.uint16)
+        self.cells = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint16)
+        self.info = {}
+
+    def reset(self, seed=None):
+        engine = self.engine
+        if seed is not None:
+            engine.bag = Shape7Bag(seed)
+        if engine.game_over and not engine.auto_restart:
+            engine.update_records_and_restart()
+        else:
+            # Abandoned games don't count as rounds.
+            engine.reset()
+        return self.observe(), self.update_info()
+
+    def step(self, action):
+        # action is (rotate, column) or (rotate, column, hold), as in TetrisEngine.step.
+        engine = self.engine
+        engine.step(*action)
+        return self.observe(), engine.reward, engine.game_over, self.update_info()
+
+    def observe(self):
+        engine = self.engine
+        self.rows[:] = engine.board.rows
+        np.bitwise_and(self.rows[:, None], COLUMN_BITS, out=self.cells)
+        np.not_equal(self.cells, 0, out=self.board, casting="unsafe")
+
+        pieces = self.pieces
+        pieces[0] = engine.falling.shape.index
+        for i in range(NUM_PREVIEWS):
+            pieces[1 + i] = engine.next_tetrominos[i].shape.index if i < len(engine.next_tetrominos) else NO_PIECE
+        pieces[-1] = engine.held.shape.index if engine.held else NO_PIECE
+        return self.observation
+
+    def update_info(self):
+        # Reused dict, like the observation.
+        engine = self.engine
+        info = self.info
+        info["lines_cleared"] = engine.last_lines_cleared
+        info["score"] = engine.score
+        info["total_lines_cleared"] = engine.total_lines_cleared
+        info["holes"] = engine.board.holes
+        info["bumpiness"] = engine.board.bumpiness
+        info["rounds"] = engine.rounds
+        return info
@@ -0,0 +1,96 @@
+# Scores every placement of a piece in one pass with NumPy.
+#
+# Afterstates are built as column bitmasks (bit 0 is the bottom row, like Board.columns), one row per candidate,
+# so heights and holes come from bit lengths and popcounts as in board.column_stats.
+
+import numpy as np
+
+from board import BoardStats, COLUMN_FULL, GRID_HEIGHT, GRID_WIDTH
+from search import DEFAULT_WEIGHTS, board_cost
+from tetromino import SHAPES
+
+# Padding slots of a piece point at this extra column, which is dropped before scoring.
+SCRATCH_COLUMN = GRID_WIDTH
+# Puts the landing row of padding slots below the floor so they never decide it.
+PADDING_BOTTOM = -GRID_HEIGHT
+
+
+class PlacementTable:
+    def __init__(self, shape):
+        # One entry per (rotation, x) in the same order get_best_action tries them.
+        rotations, xs, columns, bottoms, spans = [], [], [], [], []
+        for r, info, x in shape.drops:
+            rotations.append(r)
+            xs.append(x)
+            padding = 4 - len(info.column_profile)
+            columns.append([x + info.left + dx for dx, _, _ in info.column_profile] + [SCRATCH_COLUMN] * padding)
+            bottoms.append([bottom for _, bottom, _ in info.column_profile] + [PADDING_BOTTOM] * padding)
+            spans.append([(1 << (bottom - top + 1)) - 1 for _, bottom, top in info.column_profile] + [0] * padding)
+        self.rotations = np.array(rotations)
+        self.xs = np.array(xs)
+        self.columns = np.array(columns)
+        self.bottoms = np.array(bottoms)
+        self.spans = np.array(spans, dtype=np.int64)
+        self.candidates = np.arange(len(xs))[:, None]
+        # Indexing with this copies the board columns once per candidate.
+        self.board_columns = np.tile(np.arange(GRID_WIDTH + 1), (len(xs), 1))
+
+
+PLACEMENT_TABLES = [PlacementTable(shape) for shape in SHAPES]
+
+
+def bit_length(values):
+    # frexp's exponent is the bit length for the non-negative ints that fit in a column.
+    return np.frexp(values)[1]
+
+
+def remove_full_rows(after, full):
+    # Array version of board.remove_rows, taking the highest full row first so lower bits stay put.
+    while full.any():
+        clearing = full != 0
+        bit = np.maximum(bit_length(full) - 1, 0)
+        column_bit = bit[..., None]
+        removed = (after & ((1 << column_bit) - 1)) | (after >> (column_bit + 1) << column_bit)
+        after = np.where(clearing[..., None], removed, after)
+        full = np.where(clearing, full ^ (1 << bit), 0)
+    return after
+
+
+def evaluate_columns(heights, columns, shape):
+    # heights and columns are (..., GRID_WIDTH + 1) arrays, the last column a zero scratch column.
+    # Returns (table, y, stats) where y and the BoardStats fields are (..., candidates) arrays.
+    table = PLACEMENT_TABLES[shape.index]
+
+    # Landing row, as in Board.drop_y.
+    y = (GRID_HEIGHT - 1 - heights[..., table.columns] - table.bottoms).min(axis=-1)
+
+    # Cells above the top row fall outside COLUMN_FULL, as in Board.piece_columns.
+    masks = (table.spans << (GRID_HEIGHT - 1 - y[..., None] - table.bottoms)) & COLUMN_FULL
+    after = columns[..., table.board_columns]
+    after[..., table.candidates, table.columns] |= masks
+    after = after[..., :GRID_WIDTH]
+
+    full = np.bitwise_and.reduce(after, axis=-1)
+    lines_cleared = np.bitwise_count(full)
+    if full.any():
+        after = remove_full_rows(after, full)
+    new_heights = bit_length(after)
+    holes = (new_heights - np.bitwise_count(after)).sum(axis=-1)
+    bumpiness = np.abs(new_heights[..., 1:] - new_heights[..., :-1]).sum(axis=-1)
+    aggregate_height = new_heights.sum(axis=-1)
+    return table, y, BoardStats(lines_cleared, aggregate_height, holes, bumpiness)
+
+
+def evaluate_all(board, shape):
+    # One entry per candidate placement of shape on board.
+    heights = np.array(board.heights + [0])
+    columns = np.array(board.columns + [0], dtype=np.int64)
+    return evaluate_columns(heights, columns, shape)
+
+
+def best_placement(board, shape, weights=DEFAULT_WEIGHTS):
+    # Returns (cost, rotation, x, y) of the cheapest placement; ties go to the first one tried.
+    table, y, stats = evaluate_all(board, shape)
+    costs = board_cost(stats, weights)
+    best = int(costs.argmin())
+    return costs[best].item(), int(table.rotations[best]), int(table.xs[best]), int(y[best])
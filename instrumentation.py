@@ -0,0 +1,57 @@
+# Low-overhead per-stage latency recording with percentile summaries.
+
+import csv
+import json
+import time
+from array import array
+from contextlib import contextmanager
+
+DEFAULT_CAPACITY = 4096
+PERCENTILES = (50, 95, 99)
+
+
+class StageTimings:
+    def __init__(self, stages, capacity=DEFAULT_CAPACITY):
+        # One preallocated ring buffer of seconds per stage; old samples are overwritten.
+        self.capacity = capacity
+        self.samples = {stage: array("d", bytes(8 * capacity)) for stage in stages}
+        self.counts = dict.fromkeys(stages, 0)
+
+    def record(self, stage, seconds):
+        count = self.counts[stage]
+        self.samples[stage][count % self.capacity] = seconds
+        self.counts[stage] = count + 1
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self):
+        summary = {}
+        for stage, samples in self.samples.items():
+            count = self.counts[stage]
+            if not count:
+                continue
+            recent = sorted(samples[: min(count, self.capacity)])
+            stats = {"count": count, "mean": sum(recent) / len(recent), "max": recent[-1]}
+            for p in PERCENTILES:
+                stats[f"p{p}"] = recent[min(len(recent) - 1, len(recent) * p // 100)]
+            summary[stage] = stats
+        return summary
+
+    def dump(self, path):
+        # Writes CSV if path ends with .csv, JSON otherwise.
+        summary = self.summary()
+        with open(path, "w", newline="") as f:
+            if path.endswith(".csv"):
+                fields = ["stage", "count", "mean", "max"] + [f"p{p}" for p in PERCENTILES]
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                for stage, stats in summary.items():
+                    writer.writerow(dict(stats, stage=stage))
+            else:
+                json.dump({"time": time.time(), "stages": summary}, f, indent=2)
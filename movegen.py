@@ -0,0 +1,59 @@
+# Breadth-first search over (rotation, x, y) states of a piece, finding every lock position it can reach -
+# including tucks and slides under overhangs - and the shortest move sequence to each.
+#
+# Moves follow the engine's rules: one-column shifts, rotations without wall kicks, and a sonic drop (soft
+# drop straight to the floor). Every sequence ends with an implicit hard drop.
+
+from collections import deque
+
+from tetromino import SPAWN_X
+
+LEFT = "left"
+RIGHT = "right"
+ROTATE = "rotate"
+ROTATE_CCW = "rotate_ccw"
+SONIC_DROP = "sonic_drop"
+
+SPAWN_Y = 0
+
+
+def reachable_placements(board, shape, x=SPAWN_X, y=SPAWN_Y, rotation=0):
+    # Returns {(rotation, x, y): moves} for every lock position reachable from the given start.
+    # Breadth-first order means the first sequence found for a lock position is a shortest one.
+    rotations = shape.rotations
+    num_rotations = len(rotations)
+    start = (rotation, x, y)
+    if not board.fits(rotations[rotation], x, y):
+        return {}
+    paths = {start: ()}
+    queue = deque([start])
+    placements = {}
+    while queue:
+        state = queue.popleft()
+        r, x, y = state
+        info = rotations[r]
+        path = paths[state]
+        landing = board.landing_y(info, x, y)
+        lock = (r, x, landing)
+        # Pieces sticking out above the top would end the game.
+        if lock not in placements and landing + info.row_masks[0][0] >= 0:
+            placements[lock] = path
+
+        neighbors = [(LEFT, (r, x - 1, y)), (RIGHT, (r, x + 1, y))]
+        if num_rotations > 1:
+            neighbors.append((ROTATE, ((r + 1) % num_rotations, x, y)))
+            if num_rotations > 2:
+                neighbors.append((ROTATE_CCW, ((r - 1) % num_rotations, x, y)))
+        if landing != y:
+            neighbors.append((SONIC_DROP, lock))
+        for move, neighbor in neighbors:
+            if neighbor in paths or not board.fits(rotations[neighbor[0]], neighbor[1], neighbor[2]):
+                continue
+            paths[neighbor] = path + (move,)
+            queue.append(neighbor)
+    return placements
+
+
+def placement_moves(board, shape, rotation, x, y, start_x=SPAWN_X, start_y=SPAWN_Y):
+    # Shortest moves to one lock position, or None if it can't be reached.
+    return reachable_placements(board, shape, start_x, start_y).get((rotation, x, y))
@@ -0,0 +1,95 @@
+# Fixed-width binary replay log. One record per locked piece:
+#
+#   rows      20 x uint16  board before the piece locked, bitboard rows top to bottom
+#   piece     uint8        shape index
+#   rotation  uint8
+#   column    int8         x of the piece
+#   lines     uint8        lines cleared by the piece
+#   cost      float32      cost of the chosen action, NaN if unknown
+#   reward    int32
+#   game      uint32       round number within the run
+#
+# The reader memory-maps the file, so loading is instant and fields are views, not copies.
+
+import math
+import os
+import struct
+
+import numpy as np
+
+from board import GRID_HEIGHT
+
+MAGIC = b"TTRP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")  # magic, version, record size, grid height, reserved
+RECORD = struct.Struct(f"<{GRID_HEIGHT}HBBbBfiI")
+FLUSH_EVERY = 4096
+
+# Same layout as RECORD.
+RECORD_DTYPE = np.dtype(
+    [
+        ("rows", "<u2", (GRID_HEIGHT,)),
+        ("piece", "u1"),
+        ("rotation", "u1"),
+        ("column", "i1"),
+        ("lines", "u1"),
+        ("cost", "<f4"),
+        ("reward", "<i4"),
+        ("game", "<u4"),
+    ]
+)
+
+
+class ReplayWriter:
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, GRID_HEIGHT, 0))
+        self.buffer = bytearray()
+        self.pending = 0
+        self.records = 0
+
+    def record(self, rows, piece, rotation, column, lines, cost=None, reward=0, game=0):
+        self.buffer += RECORD.pack(
+            *rows, piece, rotation, column, lines, math.nan if cost is None else cost, reward, game
+        )
+        self.pending += 1
+        self.records += 1
+        if self.pending >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReplayReader:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, version, record_size, grid_height, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay file")
+        if record_size != RECORD.size or grid_height != GRID_HEIGHT:
+            raise ValueError(f"{path} was written with a different record layout")
+        if os.path.getsize(path) == HEADER.size:
+            # mmap cannot map an empty region.
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        else:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, key):
+        # reader["rows"], reader["piece"], ... are views into the mapped file.
+        return self.records[key]
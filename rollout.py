@@ -0,0 +1,144 @@
+# Bag-aware expectimax: scores the best few placements of the current piece by greedy rollouts over
+# sampled future pieces, in parallel.
+#
+#   python rollout.py --pieces 300 --samples 32 --horizon 14
+#
+# Pieces past the preview are unknown, but the 7-bag says which shapes the current bag still owes, so every
+# sampled future is one the randomizer could actually deal. All candidates are rolled out against the same
+# samples. The preview is known, so it is played once per candidate before any work is sent out, and the
+# samples only roll out from the resulting board.
+
+import argparse
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from board import Board
+from evaluator import best_placement
+from search import DEFAULT_WEIGHTS, board_cost, evaluate_placements
+from tetromino import SHAPES
+
+DEFAULT_SAMPLES = 16
+DEFAULT_HORIZON = 14
+DEFAULT_CANDIDATES = 6
+SAMPLES_PER_TASK = 8
+GAME_OVER_COST = 10000
+
+
+def sample_futures(known, drawn, length, count, rng):
+    # known is every dealt shape index still to be placed, oldest first; drawn is Shape7Bag.drawn.
+    # The last drawn % 7 dealt pieces belong to the current bag, so the rest of that bag comes next.
+    in_bag = drawn % len(SHAPES)
+    owed = list(range(len(SHAPES)))
+    if in_bag:
+        for shape in known[-in_bag:]:
+            owed.remove(shape)
+    futures = []
+    for _ in range(count):
+        future = rng.sample(owed, len(owed))
+        while len(future) < length:
+            future.extend(rng.sample(range(len(SHAPES)), len(SHAPES)))
+        futures.append(future[:length])
+    return futures
+
+
+def play_greedy(board, shapes, weights):
+    # Places shapes with the greedy cost policy. Returns False on game over.
+    for index in shapes:
+        shape = SHAPES[index]
+        _, r, x, y = best_placement(board, shape, weights)
+        info = shape.rotations[r]
+        if y + info.row_masks[0][0] < 0:
+            return False
+        board.place(info, x, y)
+        board.clear_lines()
+    return True
+
+
+def rollout_cost(rows, futures, weights):
+    # Total cost over futures, starting from a candidate's board after the preview.
+    board = Board(rows, track_colors=False)
+    total = 0
+    for future in futures:
+        branch = board.copy()
+        total += board_cost(branch.stats, weights) if play_greedy(branch, future, weights) else GAME_OVER_COST
+    return total
+
+
+def rollout_action(
+    board,
+    shapes,
+    drawn,
+    samples=DEFAULT_SAMPLES,
+    horizon=DEFAULT_HORIZON,
+    candidates=DEFAULT_CANDIDATES,
+    executor=None,
+    seed=None,
+    weights=DEFAULT_WEIGHTS,
+):
+    # shapes is the current shape followed by the preview queue. Returns (rotation, x, expected cost).
+    # Without an executor the rollouts run in this process.
+    placements = sorted(evaluate_placements(board, shapes[0], weights=weights))[:candidates]
+    if not placements:
+        return 0, 0, GAME_OVER_COST
+    known = [shape.index for shape in shapes]
+    futures = sample_futures(known, drawn, horizon, samples, random.Random(seed))
+    preview = known[1:]
+
+    # One task per candidate and chunk of samples. Candidates that top out in the preview need none.
+    tasks = []
+    totals = [0] * len(placements)
+    for candidate, (_, r, x, y) in enumerate(placements):
+        after = board.copy()
+        after.place(shapes[0].rotations[r], x, y)
+        after.clear_lines()
+        if not play_greedy(after, preview, weights):
+            totals[candidate] = GAME_OVER_COST * samples
+            continue
+        for i in range(0, samples, SAMPLES_PER_TASK):
+            tasks.append((candidate, after.rows, futures[i : i + SAMPLES_PER_TASK]))
+
+    if executor is None:
+        costs = [rollout_cost(rows, chunk, weights) for _, rows, chunk in tasks]
+    else:
+        futures_by_task = [executor.submit(rollout_cost, rows, chunk, weights) for _, rows, chunk in tasks]
+        costs = [future.result() for future in futures_by_task]
+    for (candidate, _, _), cost in zip(tasks, costs):
+        totals[candidate] += cost
+
+    best = min(range(len(placements)), key=lambda i: totals[i])
+    _, r, x, _ = placements[best]
+    return r, x, totals[best] / samples
+
+
+def main():
+    from engine import TetrisEngine
+
+    parser = argparse.ArgumentParser(description="Play a seeded game with bag-aware rollouts.")
+    parser.add_argument("--pieces", type=int, default=300)
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="sampled futures per decision")
+    parser.add_argument("--horizon", type=int, default=DEFAULT_HORIZON, help="pieces rolled out past the preview")
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES, help="placements rolled out")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of CPUs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    game = TetrisEngine(training_mode=True, seed=args.seed)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for piece in range(args.pieces):
+            rotate, column = game.get_rollout_action(
+                args.samples, args.horizon, args.candidates, executor, seed=args.seed + piece
+            )
+            game.step(rotate, column)
+            if game.rounds:
+                break
+    duration = time.perf_counter() - start
+    print(
+        f"Lines: {game.record_lines if game.rounds else game.total_lines_cleared}, pieces: {piece + 1}, "
+        f"game over: {game.rounds > 0}, {(piece + 1) / duration:.1f} pieces/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# Beam search over the preview queue, optionally using hold.
+
+import math
+import time
+from collections import namedtuple
+from operator import itemgetter
+
+from board import BoardStats
+from movegen import reachable_placements
+
+DEFAULT_DEPTH = 3
+DEFAULT_BEAM_WIDTH = 16
+
+# y tells tucks apart from a straight drop in the same rotation and column.
+SearchResult = namedtuple("SearchResult", ["rotation", "x", "hold", "cost", "y"])
+NO_RESULT = SearchResult(0, 0, False, math.inf, 0)
+
+
+# One weight per BoardStats feature; a zero weight leaves the feature out.
+DEFAULT_WEIGHTS = BoardStats(lines_cleared=0, aggregate_height=1, holes=20, bumpiness=2)
+
+
+def board_cost(stats, weights=DEFAULT_WEIGHTS):
+    # Also works on a BoardStats of arrays.
+    cost = 0
+    for weight, value in zip(weights, stats):
+        if weight:
+            cost = cost + weight * value
+    return cost
+
+
+def parse_weights(text):
+    # "holes=20,bumpiness=2" -> BoardStats of weights; features not listed get 0.
+    weights = dict.fromkeys(BoardStats._fields, 0)
+    for item in text.split(","):
+        feature, _, weight = item.partition("=")
+        feature = feature.strip()
+        if feature not in weights:
+            raise ValueError(f"unknown feature {feature!r}, expected one of {', '.join(BoardStats._fields)}")
+        weights[feature] = float(weight)
+    return BoardStats(**weights)
+
+
+def placements(board, shape):
+    # Returns (rotation, rotation info, x, y) for every straight drop.
+    drop_y = board.drop_y
+    found = []
+    for r, info, x in shape.drops:
+        y = drop_y(info, x)
+        # Pieces sticking out above the top would end the game.
+        if y + info.row_masks[0][0] >= 0:
+            found.append((r, info, x, y))
+    return found
+
+
+def all_placements(board, shape):
+    # Every lock position reachable from spawn, see movegen.
+    rotations = shape.rotations
+    return [(r, rotations[r], x, y) for r, x, y in reachable_placements(board, shape)]
+
+
+def evaluate_placements(board, shape, table=None, weights=DEFAULT_WEIGHTS, reachable=False):
+    # Returns (cost, rotation, x, y) for every placement of shape.
+    # reachable adds tucks and spins to the straight drops.
+    if table is not None:
+        key = ("placements", tuple(board.rows), shape.index, weights, reachable)
+        evaluated = table.get(key)
+        if evaluated is not None:
+            return evaluated
+    candidates = all_placements(board, shape) if reachable else placements(board, shape)
+    evaluated = [(board_cost(board.stats_after(info, x, y), weights), r, x, y) for r, info, x, y in candidates]
+    if table is not None:
+        table.put(key, evaluated)
+    return evaluated
+
+
+class SearchBudget:
+    # Wall-clock and/or node limit for anytime_search. A node is one evaluated placement.
+    def __init__(self, seconds=None, nodes=None):
+        self.deadline = None if seconds is None else time.perf_counter() + seconds
+        self.max_nodes = nodes
+        self.nodes = 0
+
+    def spend(self, nodes):
+        # Returns True once the budget is used up.
+        self.nodes += nodes
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            return True
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+
+class SearchNode:
+    def __init__(self, board, held, index, action, cost):
+        self.board = board
+        self.held = held
+        # Position in the piece list of the next piece to place.
+        self.index = index
+        # First placement on the path from the root, as (rotation, x, hold, y).
+        self.action = action
+        self.cost = cost
+
+    def choices(self, pieces, use_hold):
+        # Yields (shape to place, held shape after, next index, hold used).
+        current = pieces[self.index]
+        yield current, self.held, self.index + 1, False
+        if not use_hold or current is self.held:
+            return
+        if self.held is None:
+            # Holding into an empty slot brings in the next piece.
+            if self.index + 1 < len(pieces):
+                yield pieces[self.index + 1], current, self.index + 2, True
+        else:
+            yield self.held, current, self.index + 1, True
+
+
+def expand_beam(beam, pieces, beam_width, use_hold, table=None, weights=DEFAULT_WEIGHTS, reachable=False, budget=None):
+    # Afterstates are scored with stats_after; only the survivors get a board copy.
+    # Returns None if the budget runs out before the layer is complete.
+    candidates = []
+    for node in beam:
+        if node.index >= len(pieces):
+            continue
+        for shape, held, index, hold in node.choices(pieces, use_hold):
+            evaluated = evaluate_placements(node.board, shape, table, weights, reachable)
+            for cost, r, x, y in evaluated:
+                info = shape.rotations[r]
+                candidates.append((cost, node, info, x, y, held, index, node.action or (r, x, hold, y)))
+            if budget is not None and budget.spend(len(evaluated)):
+                return None
+    candidates.sort(key=itemgetter(0))
+
+    next_beam = []
+    seen = set()
+    for cost, parent, info, x, y, held, index, action in candidates:
+        board = parent.board.copy()
+        board.place(info, x, y)
+        board.clear_lines()
+        # Different paths often reach the same afterstate.
+        key = (tuple(board.rows), held, index)
+        if key in seen:
+            continue
+        seen.add(key)
+        next_beam.append(SearchNode(board, held, index, action, cost))
+        if len(next_beam) == beam_width:
+            break
+    return next_beam
+
+
+def beam_search(
+    board,
+    pieces,
+    held=None,
+    depth=DEFAULT_DEPTH,
+    beam_width=DEFAULT_BEAM_WIDTH,
+    use_hold=True,
+    table=None,
+    weights=DEFAULT_WEIGHTS,
+    reachable=False,
+):
+    # pieces is the current shape followed by the preview queue.
+    # table, a TranspositionTable, is shared by placement evaluations and whole searches.
+    if table is not None:
+        key = (
+            "search",
+            tuple(board.rows),
+            held.index if held else None,
+            tuple(shape.index for shape in pieces),
+            depth,
+            beam_width,
+            use_hold,
+            weights,
+            reachable,
+        )
+        result = table.get(key)
+        if result is not None:
+            return result
+
+    beam = [SearchNode(board, held, 0, None, 0)]
+    for _ in range(depth):
+        next_beam = expand_beam(beam, pieces, beam_width, use_hold, table, weights, reachable)
+        if not next_beam:
+            break
+        beam = next_beam
+
+    result = best_result(beam)
+    if table is not None:
+        table.put(key, result)
+    return result
+
+
+def best_result(beam):
+    best = min(beam, key=lambda node: node.cost)
+    if best.action is None:
+        return NO_RESULT
+    rotation, x, hold, y = best.action
+    return SearchResult(rotation, x, hold, best.cost, y)
+
+
+def anytime_search(
+    board,
+    pieces,
+    held=None,
+    budget=None,
+    max_depth=None,
+    beam_width=DEFAULT_BEAM_WIDTH,
+    use_hold=True,
+    table=None,
+    weights=DEFAULT_WEIGHTS,
+    reachable=False,
+):
+    # Beam search one piece deeper at a time until the SearchBudget runs out or the preview is used up.
+    # Returns (result, depth) where result comes from the deepest complete layer. The first piece is always
+    # searched in full, so there is an answer however small the budget.
+    beam = [SearchNode(board, held, 0, None, 0)]
+    result, depth = NO_RESULT, 0
+    while max_depth is None or depth < max_depth:
+        next_beam = expand_beam(
+            beam, pieces, beam_width, use_hold, table, weights, reachable, budget if depth else None
+        )
+        if not next_beam:
+            break
+        beam = next_beam
+        depth += 1
+        result = best_result(beam)
+    return result, depth
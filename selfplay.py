@@ -0,0 +1,117 @@
+# Plays many seeded headless games across a process pool.
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import TetrisEngine
+from search import DEFAULT_BEAM_WIDTH, DEFAULT_WEIGHTS, parse_weights
+from surfaces import SurfaceTable
+
+GAMES_PER_TASK = 4
+
+
+def play_game(seed, pieces_per_game, depth=1, beam_width=DEFAULT_BEAM_WIDTH, weights=DEFAULT_WEIGHTS, surfaces=None):
+    game = TetrisEngine(training_mode=True, seed=seed, weights=weights, surfaces=surfaces)
+    start = time.perf_counter()
+    pieces = 0
+    while pieces < pieces_per_game and game.rounds == 0:
+        if depth > 1:
+            rotate, column, hold = game.get_lookahead_action(depth, beam_width)
+        else:
+            (rotate, column), hold = game.get_best_action(), False
+        game.step(rotate, column, hold)
+        pieces += 1
+    game_over = game.rounds > 0
+    return {
+        "seed": seed,
+        "pieces": pieces,
+        # A game over resets the engine, so the finished game's numbers are in the records.
+        "lines": game.record_lines if game_over else game.total_lines_cleared,
+        "score": game.record_score if game_over else game.score,
+        "game_over": game_over,
+        "duration": time.perf_counter() - start,
+    }
+
+
+def play_games(seeds, pieces_per_game, depth, beam_width, weights=DEFAULT_WEIGHTS, surfaces_path=None):
+    worker = os.getpid()
+    # The table is memory-mapped, so each worker opens it rather than receiving a pickled copy.
+    surfaces = SurfaceTable(surfaces_path) if surfaces_path else None
+    return [
+        dict(play_game(seed, pieces_per_game, depth, beam_width, weights, surfaces), worker=worker) for seed in seeds
+    ]
+
+
+def summarize(results, duration=None):
+    pieces = sum(r["pieces"] for r in results)
+    if duration is None:
+        duration = sum(r["duration"] for r in results)
+    return {
+        "games": len(results),
+        "pieces": pieces,
+        "lines": sum(r["lines"] for r in results),
+        "mean_lines": sum(r["lines"] for r in results) / len(results),
+        "mean_score": sum(r["score"] for r in results) / len(results),
+        "max_score": max(r["score"] for r in results),
+        "game_overs": sum(r["game_over"] for r in results),
+        "pieces_per_sec": pieces / duration if duration else 0.0,
+    }
+
+
+def run(
+    games,
+    pieces_per_game,
+    workers=None,
+    seed=0,
+    depth=1,
+    beam_width=DEFAULT_BEAM_WIDTH,
+    weights=DEFAULT_WEIGHTS,
+    surfaces_path=None,
+):
+    seeds = list(range(seed, seed + games))
+    chunks = [seeds[i : i + GAMES_PER_TASK] for i in range(0, games, GAMES_PER_TASK)]
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(play_games, chunk, pieces_per_game, depth, beam_width, weights, surfaces_path)
+            for chunk in chunks
+        ]
+        for future in futures:
+            results.extend(future.result())
+    duration = time.perf_counter() - start
+
+    by_worker = {}
+    for result in results:
+        by_worker.setdefault(result["worker"], []).append(result)
+    return {
+        "overall": summarize(results, duration),
+        "workers": {worker: summarize(worker_results) for worker, worker_results in by_worker.items()},
+        "games": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel headless self-play.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--pieces", type=int, default=1000, help="pieces per game")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of CPUs")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--depth", type=int, default=1, help="pieces to look ahead; 1 is the greedy player")
+    parser.add_argument("--beam-width", type=int, default=DEFAULT_BEAM_WIDTH)
+    parser.add_argument("--weights", type=parse_weights, default=DEFAULT_WEIGHTS, help='e.g. "holes=20,bumpiness=2"')
+    parser.add_argument("--surfaces", help="surfaces.py table answering low, hole-free boards at depth 1")
+    args = parser.parse_args()
+
+    report = run(
+        args.games, args.pieces, args.workers, args.seed, args.depth, args.beam_width, args.weights, args.surfaces
+    )
+    for worker, stats in sorted(report["workers"].items()):
+        print(f"Worker {worker}: {stats}")
+    print(f"Overall: {report['overall']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Offline table of the greedy best move for low, hole-free boards.
+#
+#   python surfaces.py                         # every surface up to DEFAULT_MAX_HEIGHT
+#   python surfaces.py --max-height 4 --sample 2000000
+#
+# A hole-free board is fully described by its column heights (its lowest column is always empty, or the
+# bottom row would have been cleared), so for these boards the stored move is exactly what
+# get_best_action would pick. The file is a small header followed by one uint8 per (shape, surface): the
+# index into shape.drops of the best placement, or UNKNOWN. It is memory-mapped for lookups.
+
+import argparse
+import struct
+import sys
+import time
+
+import numpy as np
+
+from board import GRID_WIDTH
+from evaluator import evaluate_columns
+from search import DEFAULT_WEIGHTS, board_cost
+from tetromino import SHAPES
+
+MAGIC = b"TTSM"
+VERSION = 1
+HEADER = struct.Struct(f"<4sHH{len(DEFAULT_WEIGHTS)}d")  # magic, version, max height, cost weights
+UNKNOWN = 255
+DEFAULT_PATH = "surface_moves.bin"
+DEFAULT_MAX_HEIGHT = 3
+CHUNK_SIZE = 8192
+
+
+def num_surfaces(max_height):
+    return (max_height + 1) ** GRID_WIDTH
+
+
+def surface_heights(indexes, max_height):
+    # Surface index -> (N, GRID_WIDTH) heights; column x is digit x in base max_height + 1.
+    return indexes[:, None] // (max_height + 1) ** np.arange(GRID_WIDTH) % (max_height + 1)
+
+
+def best_drops(heights, shape, weights=DEFAULT_WEIGHTS):
+    # Index into shape.drops of the best placement for each row of heights, all hole-free.
+    heights = np.concatenate([heights, np.zeros((len(heights), 1), dtype=heights.dtype)], axis=1)
+    columns = (1 << heights) - 1
+    _, _, stats = evaluate_columns(heights, columns, shape)
+    return board_cost(stats, weights).argmin(axis=1)
+
+
+def build(path, max_height=DEFAULT_MAX_HEIGHT, weights=DEFAULT_WEIGHTS, sample=None, seed=0):
+    total = num_surfaces(max_height)
+    if sample is None:
+        indexes = np.arange(total, dtype=np.int64)
+    else:
+        indexes = np.unique(np.random.default_rng(seed).integers(0, total, sample))
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, max_height, *weights))
+    moves = np.memmap(path, dtype=np.uint8, mode="r+", offset=HEADER.size, shape=(len(SHAPES), total))
+    moves[:] = UNKNOWN
+    for shape in SHAPES:
+        start = time.perf_counter()
+        for i in range(0, len(indexes), CHUNK_SIZE):
+            chunk = indexes[i : i + CHUNK_SIZE]
+            moves[shape.index, chunk] = best_drops(surface_heights(chunk, max_height), shape, weights)
+        print(f"Shape {shape.index}: {len(indexes)} surfaces in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    moves.flush()
+
+
+class SurfaceTable:
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as f:
+            magic, version, self.max_height, *weights = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} surface table")
+        self.weights = tuple(weights)
+        self.base = self.max_height + 1
+        self.moves = np.memmap(
+            path, dtype=np.uint8, mode="r", offset=HEADER.size, shape=(len(SHAPES), num_surfaces(self.max_height))
+        )
+
+    def lookup(self, board, shape, weights=DEFAULT_WEIGHTS):
+        # Returns (rotation, x) or None if the board is not covered.
+        if board.holes or tuple(weights) != self.weights:
+            return None
+        index = 0
+        for height in reversed(board.heights):
+            if height > self.max_height:
+                return None
+            index = index * self.base + height
+        entry = self.moves[shape.index, index]
+        if entry == UNKNOWN:
+            return None
+        r, _, x = shape.drops[entry]
+        return r, x
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute greedy best moves for low, hole-free boards.")
+    parser.add_argument("--output", default=DEFAULT_PATH)
+    parser.add_argument("--max-height", type=int, default=DEFAULT_MAX_HEIGHT)
+    parser.add_argument("--sample", type=int, help="only fill this many random surfaces per shape")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    build(args.output, args.max_height, sample=args.sample, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,23 @@
 # Tetr.io
 
+import queue
 import random
+import threading
 import time
 import timeit
+from collections import namedtuple
 
 import mss
+import numpy as np
 import pyautogui
 import pygame
-from PIL import Image
 
-from tetris import TetrisGame, GRID_WIDTH, GRID_HEIGHT
+from board import Board, GRID_WIDTH, GRID_HEIGHT
+from engine import SPAWN_X
+from search import SearchBudget
+from movegen import LEFT, RIGHT, ROTATE, ROTATE_CCW, SONIC_DROP
+from instrumentation import StageTimings
+from tetris import TetrisGame
 from tetromino import Tetromino, SHAPES
 
 TETRIO_BLACK = (9, 7, 5)
@@ -28,6 +36,39 @@ BOARD_OFFSET_X = 314
 BOARD_OFFSET_Y = 184
 
 IGNORE_ROWS = 8  # a hack.
+NEARLY_BLACK = 30
+
+# Pixel coordinates sampled for each board cell.
+BOARD_SAMPLE_X = (BOARD_OFFSET_X + 30 + np.arange(GRID_WIDTH) * CELL_SIZE).astype(int)
+BOARD_SAMPLE_Y = (BOARD_OFFSET_Y + 30 + np.arange(IGNORE_ROWS, GRID_HEIGHT) * CELL_SIZE).astype(int)
+COLUMN_BITS = 1 << np.arange(GRID_WIDTH)
+# Hold slot first, then the upcoming pieces.
+PIECE_CENTERS = [(HOLD_OFFSET_X, PIECES_OFFSET_Y)] + [
+    (UPCOMING_OFFSET_X, PIECES_OFFSET_Y + UPCOMING_SPACE * i) for i in range(5)
+]
+# Every SIGNATURE_STRIDE-th pixel of the piece windows, for cheap change detection.
+SIGNATURE_STRIDE = 4
+_SIGNATURE_OFFSETS = np.arange(-TETROMINO_SAMPLE_RADIUS, TETROMINO_SAMPLE_RADIUS, SIGNATURE_STRIDE)
+SIGNATURE_X = np.array([int(x) + _SIGNATURE_OFFSETS for x, _ in PIECE_CENTERS])
+SIGNATURE_Y = np.array([int(y) + _SIGNATURE_OFFSETS for _, y in PIECE_CENTERS])
+
+HOLD_KEY = "c"
+# Per-piece thinking time; the search deepens through the preview until it runs out.
+SEARCH_SECONDS = 0.05
+SEARCH_MAX_DEPTH = 6
+# Sonic drop needs tetr.io's soft drop factor set to infinite.
+MOVE_KEYS = {LEFT: "left", RIGHT: "right", ROTATE: "up", ROTATE_CCW: "z", SONIC_DROP: "down"}
+
+# Pipeline between the capture, decision and input threads.
+FRAME_QUEUE_SIZE = 1
+ACTION_QUEUE_SIZE = 1
+QUEUE_TIMEOUT = 0.1
+POLL_INTERVAL = 0.002
+RENDER_INTERVAL = 1 / 30
+
+STAGES = ("capture", "decode", "board_parse", "queue_classification", "search", "input", "render", "end_to_end")
+STATS_PATH = "tetrio_latency.json"
+STATS_INTERVAL = 10
 
 SAMPLED_COLORS = [
     (158, 83, 156),
@@ -39,45 +80,63 @@ SAMPLED_COLORS = [
     (99, 180, 142),
     (30, 30, 30),  # Nothing
 ]
-COLOR_TO_SHAPE = dict(zip(SAMPLED_COLORS, SHAPES + [None]))
+# Bits per channel of the color lookup table, and when a classification is too unsure to use.
+LUT_BITS = 5
+MAX_COLOR_DISTANCE = 30
+MIN_COLOR_MARGIN = 8
+# Consecutive polls with an ambiguous slot before the nearest centroid is trusted anyway, e.g. after a theme change.
+MAX_AMBIGUOUS_POLLS = 25
+SLOT_NAMES = ["hold"] + [f"upcoming {i}" for i in range(1, 6)]
+
+
+def decode_frame(raw):
+    # Zero-copy (height, width, 4) BGRA view of an mss capture.
+    return np.frombuffer(raw.bgra, dtype=np.uint8).reshape(raw.height, raw.width, 4)
+
 
+def grab_frame(sct):
+    return decode_frame(sct.grab(GAME_AREA))
 
-def nearly_black(color):
-    return all([c < 30 for c in color])
 
+def mean_colors(frame, centers):
+    # Mean RGB of the (2 * radius) square window around each center, in one gather.
+    lows = (np.asarray(centers) - TETROMINO_SAMPLE_RADIUS).astype(int)
+    offsets = np.arange(2 * TETROMINO_SAMPLE_RADIUS)
+    xs = lows[:, 0, None] + offsets
+    ys = lows[:, 1, None] + offsets
+    windows = frame[ys[:, :, None], xs[:, None, :], 2::-1]
+    return windows.sum(axis=(1, 2), dtype=np.int64) // NUM_SAMPLE_PIXELS
 
-def mean_color_near(im: Image, x, y):
-    r, g, b = 0, 0, 0
-    for i in range(int(x - TETROMINO_SAMPLE_RADIUS), int(x + TETROMINO_SAMPLE_RADIUS)):
-        for j in range(int(y - TETROMINO_SAMPLE_RADIUS), int(y + TETROMINO_SAMPLE_RADIUS)):
-            l, m, n = im.getpixel((i, j))
-            r += l
-            g += m
-            b += n
-    return r // NUM_SAMPLE_PIXELS, g // NUM_SAMPLE_PIXELS, b // NUM_SAMPLE_PIXELS
-    # return im.crop(
-    #     (
-    #         x - TETROMINO_SAMPLE_RADIUS,
-    #         y - TETROMINO_SAMPLE_RADIUS,
-    #         x + TETROMINO_SAMPLE_RADIUS,
-    #         y + TETROMINO_SAMPLE_RADIUS,
-    #     )
-    # )
 
+class ColorClassifier:
+    # Nearest-centroid classification through a quantized RGB lookup table built once at startup.
+    def __init__(self, colors=SAMPLED_COLORS + [TETRIO_BLACK], shapes=SHAPES + [None, None], bits=LUT_BITS):
+        self.shapes = shapes
+        self.shift = 8 - bits
+        levels = 1 << bits
+        # Classify the center of every quantization bin.
+        centers = (np.arange(levels) << self.shift) + (1 << self.shift) // 2
+        grid = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), axis=-1).reshape(-1, 1, 3)
+        distances = np.sqrt(((grid - np.array(colors)) ** 2).sum(axis=-1))
+        labels = distances.argmin(axis=1)
+        best = distances.min(axis=1)
+        # Margin to the closest centroid of a different shape; several colors may mean the same shape.
+        shape_ids = np.array([shapes.index(shape) for shape in shapes])
+        same_shape = shape_ids[labels][:, None] == shape_ids[None, :]
+        runner_up = np.where(same_shape, np.inf, distances).min(axis=1)
+        self.labels = labels.astype(np.uint8).reshape(levels, levels, levels)
+        self.distances = best.astype(np.float32).reshape(levels, levels, levels)
+        self.margins = (runner_up - best).astype(np.float32).reshape(levels, levels, levels)
 
-def square_distance(c1, c2):
-    return (c1[0] - c2[0]) ** 2 + (c1[1] - c2[1]) ** 2 + (c1[2] - c2[2]) ** 2
+    def classify(self, colors):
+        # colors is an (N, 3) RGB array. Returns shapes, distances to their centroid, and ambiguity flags.
+        r, g, b = (np.asarray(colors, dtype=np.int64) >> self.shift).T
+        distances = self.distances[r, g, b]
+        ambiguous = (distances > MAX_COLOR_DISTANCE) | (self.margins[r, g, b] < MIN_COLOR_MARGIN)
+        return [self.shapes[i] for i in self.labels[r, g, b]], distances, ambiguous
 
 
-def map_color_to_shape(sample_color):
-    distance_min = 3 * (256**2)
-    best_guess = None
-    for color, shape in COLOR_TO_SHAPE.items():
-        distance = square_distance(sample_color, color)
-        if distance < distance_min:
-            distance_min = distance
-            best_guess = shape
-    return best_guess
+CLASSIFIER = ColorClassifier()
 
 
 def press_keys(seq):
@@ -86,98 +145,185 @@ def press_keys(seq):
         time.sleep(random.uniform(0.08, 0.15))
 
 
-def take_action(rotate, column):
-    seq = []
-    for _ in range(rotate):
-        seq.append("up")
-
-    movement = column - 3
-    if movement != 0:
-        distance = abs(movement)
-        key = "left" if movement < 0 else "right"
-        for _ in range(distance):
-            seq.append(key)
+def take_action(moves, hold=False):
+    # moves come from movegen, e.g. TetrisEngine.get_lookahead_moves.
+    seq = [HOLD_KEY] if hold else []
+    seq.extend(MOVE_KEYS[move] for move in moves)
     seq.append("space")
 
     press_keys(seq)
 
 
+def frame_signature(frame):
+    # The board samples are exactly what parse_board reads; the piece windows are subsampled.
+    board = frame[BOARD_SAMPLE_Y[:, None], BOARD_SAMPLE_X[None, :], :3]
+    pieces = frame[SIGNATURE_Y[:, :, None], SIGNATURE_X[:, None, :], :3]
+    return board.tobytes() + pieces.tobytes()
+
+
+def parse_board(frame):
+    # frame is a BGR(A) array, e.g. from grab_frame.
+    samples = frame[BOARD_SAMPLE_Y[:, None], BOARD_SAMPLE_X[None, :], 2::-1]
+    filled = (samples >= NEARLY_BLACK).any(axis=2)
+    rows = [0] * IGNORE_ROWS + (filled * COLUMN_BITS).sum(axis=1).tolist()
+    colors = [[None] * GRID_WIDTH for _ in range(GRID_HEIGHT)]
+    for y, x in zip(*np.nonzero(filled)):
+        colors[IGNORE_ROWS + y][x] = tuple(samples[y, x].tolist())
+    return Board(rows, colors)
+
+
+def parse_pieces(frame):
+    # Returns the held shape (None if empty), the five upcoming shapes, and (slot, color, distance) of every
+    # ambiguous slot.
+    colors = mean_colors(frame, PIECE_CENTERS)
+    shapes, distances, ambiguous = CLASSIFIER.classify(colors)
+    doubts = [(SLOT_NAMES[i], tuple(colors[i].tolist()), float(distances[i])) for i in np.flatnonzero(ambiguous)]
+    return shapes[0], shapes[1:], doubts
+
+
+Frame = namedtuple("Frame", ["board", "held", "upcoming", "captured_at"])
+
+
+def put_latest(q: queue.Queue, item):
+    # Drops the oldest item when full, so the consumer always gets the freshest item.
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+
 class TetrioProxy:
-    def __init__(self, game: TetrisGame):
+    # Capture, decision and input run in their own threads; the main thread only renders.
+    def __init__(self, game: TetrisGame, stats_path=STATS_PATH):
         self.game = game
+        self.timings = StageTimings(STAGES)
+        self.stats_path = stats_path
+        self.frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.actions = queue.Queue(maxsize=ACTION_QUEUE_SIZE)
+        self.stopped = threading.Event()
+        # Set when the mirrored state changed and needs a redraw.
+        self.changed = threading.Event()
 
-    def mirror_board(self):
+    def capture_loop(self):
+        # mss handles are not thread-safe, so the capture thread owns its own.
         sct = mss.mss()
-        old_next = None
-        old_next_shape_indexes = None
-        while True:
-            locked_positions = {}
+        timings = self.timings
+        old_signature = None
+        ambiguous_polls = 0
+        while not self.stopped.is_set():
             start = timeit.default_timer()
-            raw = sct.grab(GAME_AREA)
-            screenshot = Image.frombytes("RGB", raw.size, raw.bgra, "raw", "BGRX")
-            screenshot_duration = timeit.default_timer() - start
-
-            pixel_x = BOARD_OFFSET_X + 30
-            for x in range(GRID_WIDTH):
-                pixel_y = BOARD_OFFSET_Y + 30
-                for y in range(GRID_HEIGHT):
-                    if y >= IGNORE_ROWS:
-                        pixel_color = screenshot.getpixel((pixel_x, pixel_y))
-                        if not nearly_black(pixel_color):
-                            locked_positions[(x, y)] = pixel_color
-                    pixel_y += CELL_SIZE
-                pixel_x += CELL_SIZE
-            game.locked_positions = locked_positions
-            game.update_grid()
+            with timings.time("capture"):
+                raw = sct.grab(GAME_AREA)
+            with timings.time("decode"):
+                frame = decode_frame(raw)
+                signature = frame_signature(frame)
+            # Only parse when the board or the queue changed on screen.
+            if signature != old_signature:
+                with timings.time("queue_classification"):
+                    held, upcoming, doubts = parse_pieces(frame)
+                # Ambiguous colors are usually mid-animation; retry on the next poll. If they don't go away, the
+                # colors have drifted from the centroids, so go with the nearest one rather than stall.
+                if doubts:
+                    ambiguous_polls += 1
+                if not doubts or ambiguous_polls >= MAX_AMBIGUOUS_POLLS:
+                    for slot, color, distance in doubts:
+                        print(f"Unsure of {slot} slot: color {color} is {distance:.0f} from the nearest centroid")
+                    ambiguous_polls = 0
+                    old_signature = signature
+                    with timings.time("board_parse"):
+                        board = parse_board(frame)
+                    put_latest(self.frames, Frame(board, held, upcoming, start))
+            time.sleep(POLL_INTERVAL)
+
+    def decide_loop(self):
+        game = self.game
+        old_upcoming = None
+        # Holding into an empty slot shifts the queue once more, on top of the shift when the piece locks.
+        hold_shift_pending = False
+        while not self.stopped.is_set():
+            try:
+                frame = self.frames.get(timeout=QUEUE_TIMEOUT)
+            except queue.Empty:
+                continue
+
+            game.board = frame.board
+            game.held = Tetromino(0, 0, frame.held) if frame.held else None
+            # The falling piece has already left this queue, so it is the preview the search sees.
+            game.next_tetrominos = [Tetromino(SPAWN_X, -1, shape) for shape in frame.upcoming if shape]
+            if old_upcoming and old_upcoming != frame.upcoming and old_upcoming[0] and hold_shift_pending:
+                hold_shift_pending = False
+                if old_upcoming[1:] == frame.upcoming[:-1]:
+                    # Only the hold so far; the piece that came out of the queue is still being placed.
+                    old_upcoming = frame.upcoming
+                else:
+                    # The frame between the hold and the lock was missed, so the queue moved twice.
+                    old_upcoming = old_upcoming[1:]
+            if old_upcoming and old_upcoming != frame.upcoming and old_upcoming[0]:
+                # Upcoming list changed, meaning that one is falling down now.
+                if old_upcoming[1:] != frame.upcoming[: len(old_upcoming) - 1]:
+                    print(f"Queue out of sync: {old_upcoming} -> {frame.upcoming}")
+                game.falling = Tetromino(SPAWN_X, -1, old_upcoming[0])
+                with self.timings.time("search"):
+                    budget = SearchBudget(seconds=SEARCH_SECONDS)
+                    hold, moves = game.get_lookahead_moves(SEARCH_MAX_DEPTH, budget=budget)
+                latency = timeit.default_timer() - frame.captured_at
+                self.timings.record("end_to_end", latency)
+                print(
+                    f"{game.falling.shape.index}: {'hold, ' if hold else ''}best moves {' '.join(moves)}, "
+                    f"depth {game.search_depth}. Latency: {latency:.3f}"
+                )
+                hold_shift_pending = hold and game.held is None
+                # A newer decision replaces one the input thread hasn't started on yet.
+                put_latest(self.actions, (moves, hold))
+            old_upcoming = frame.upcoming
+            self.changed.set()
+
+    def input_loop(self):
+        while not self.stopped.is_set():
+            try:
+                action = self.actions.get(timeout=QUEUE_TIMEOUT)
+            except queue.Empty:
+                continue
+            with self.timings.time("input"):
+                take_action(*action)
+
+    def mirror_board(self):
+        game = self.game
+        threads = [
+            threading.Thread(target=loop, daemon=True)
+            for loop in (self.capture_loop, self.decide_loop, self.input_loop)
+        ]
+        for thread in threads:
+            thread.start()
+
+        last_dump = timeit.default_timer()
+        while not self.stopped.is_set():
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    break
-
-            # Figure out the held piece.
-            mean_color = mean_color_near(screenshot, HOLD_OFFSET_X, PIECES_OFFSET_Y)
-            shape = map_color_to_shape(mean_color)
-            game.held = Tetromino(0, 0, shape)
-
-            next_tetrominos = []
-            for i in range(5):
-                mean_color = mean_color_near(screenshot, UPCOMING_OFFSET_X, PIECES_OFFSET_Y + UPCOMING_SPACE * i)
-                shape = map_color_to_shape(mean_color)
-                next_tetrominos.append(Tetromino(GRID_WIDTH // 2 - 2, -1, shape))
-            next_shape_indexes = [t.shape.index for t in next_tetrominos]
-            print(old_next_shape_indexes)
-            print(next_shape_indexes)
-            if old_next and old_next_shape_indexes != next_shape_indexes:
-                # Upcoming list changed, meaning that one is falling down now.
-                # print(f"old: {len(old_next)}; new: {len(next_tetrominos)}")
-                # print([t.shape.index for t in old_next])
-                # print([t.shape.index for t in next_tetrominos])
-                game.falling = old_next[0]
-                # print([t.shape.index for t in old_next])
-                # print([t.shape.index for t in next_tetrominos])
-                # print(old_next)
-                # print(next_tetrominos)
-                assert old_next_shape_indexes[1:] == next_shape_indexes[:-1]
-                best_r, best_x = game.get_best_action()
-                print(game.falling.shape.index)
-                print(f"Best action: {best_r}#{best_x-3}. Time: {screenshot_duration:.3f}, {total_duration:.3f}")
-                # time.sleep(3)
-                take_action(best_r, best_x)
-            old_next = next_tetrominos
-            old_next_shape_indexes = next_shape_indexes
-            game.next_tetrominos = next_tetrominos
-
-            game.update_screen()
-            total_duration = timeit.default_timer() - start
-            # hold_sample = sample_image(screenshot, UPCOMING_OFFSET_X, PIECES_OFFSET_Y + UPCOMING_SPACE * (i % 5))
-            # pygame_image = pygame.image.fromstring(hold_sample.tobytes(), hold_sample.size, hold_sample.mode)
-            # game.screen.blit(pygame_image, (0, 0))
-            # pygame.display.update()
-            # i += 1
-            time.sleep(random.uniform(0.1, 0.2))
+                    self.stopped.set()
+            if self.changed.is_set():
+                self.changed.clear()
+                with self.timings.time("render"):
+                    game.update_grid()
+                    game.update_screen()
+            if self.stats_path and timeit.default_timer() - last_dump > STATS_INTERVAL:
+                last_dump = timeit.default_timer()
+                self.timings.dump(self.stats_path)
+            time.sleep(RENDER_INTERVAL)
+
+        for thread in threads:
+            thread.join()
+        if self.stats_path:
+            self.timings.dump(self.stats_path)
+        pygame.quit()
 
 
 if __name__ == "__main__":
-    game = TetrisGame(training_mode=True, mirror_mode=True)
+    game = TetrisGame(training_mode=True, mirror_mode=True, dirty_rects=True)
     proxy = TetrioProxy(game)
     proxy.mirror_board()
@@ -3,7 +3,9 @@ import pygame
 import time
 import sys
 
-from tetromino import Tetromino
+from board import GRID_WIDTH, GRID_HEIGHT
+from engine import TetrisEngine
+from search import DEFAULT_WEIGHTS
 
 LEFT_SIDEBAR_WIDTH = 200
 
@@ -11,8 +13,6 @@ LEFT_SIDEBAR_WIDTH = 200
 TOP_PADDING = 50
 BOTTOM_PADDING = 50
 GRID_SIZE = 30
-GRID_WIDTH = 10
-GRID_HEIGHT = 20
 
 # Preview area dimensions
 PREVIEW_WIDTH = 4
@@ -35,8 +35,8 @@ RESTART_OFFSET_Y = 400
 SCREEN_WIDTH = LEFT_SIDEBAR_WIDTH + GRID_SIZE * (PREVIEW_WIDTH + GRID_WIDTH) + 100
 SCREEN_HEIGHT = GRID_SIZE * GRID_HEIGHT + TOP_PADDING + BOTTOM_PADDING
 
-SCORE_FACTORS = [0, 40, 100, 300, 1200]
-LINES_PER_LEVEL = 10
+FONT_SIZE = 24
+TEXT_CACHE_SIZE = 256
 
 # Colors
 WHITE = (255, 255, 255)
@@ -45,145 +45,111 @@ BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 
-
-class TetrisGame:
-    def __init__(self, training_mode=False, mirror_mode=False):
-        self.training_mode = training_mode
-        self.mirror_mode = mirror_mode
-
+# Areas cleared and redrawn as a whole when their contents change.
+PANEL_RECTS = {
+    "preview": (
+        LEFT_SIDEBAR_WIDTH + GRID_WIDTH * GRID_SIZE,
+        0,
+        SCREEN_WIDTH - LEFT_SIDEBAR_WIDTH - GRID_WIDTH * GRID_SIZE,
+        SCREEN_HEIGHT,
+    ),
+    "sidebar": (0, 0, LEFT_SIDEBAR_WIDTH, SCREEN_HEIGHT),
+}
+
+
+# Renders a TetrisEngine with pygame.
+class TetrisGame(TetrisEngine):
+    # dirty_rects only redraws cells and panels that changed since the last frame.
+    # render_fps caps frames per second; render_every draws once every N pieces in step().
+    def __init__(
+        self,
+        training_mode=False,
+        mirror_mode=False,
+        table=None,
+        seed=None,
+        recorder=None,
+        weights=DEFAULT_WEIGHTS,
+        auto_restart=True,
+        surfaces=None,
+        dirty_rects=False,
+        render_fps=None,
+        render_every=None,
+    ):
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("Tetris")
-        self.rounds = 0
-        self.record_level = 0
-        self.record_lines = 0
-        self.record_score = 0
-        self.reset()
+        self.font = pygame.font.Font(None, FONT_SIZE)
+        self.text_surfaces = {}
+        self.cell_sprites = {}
+
+        self.dirty_rects = dirty_rects
+        self.render_fps = render_fps
+        self.render_every = render_every
+        self.pieces_placed = 0
+        self.last_render_piece = 0
+        self.last_render_time = 0
+        # What is on screen, for dirty_rects: cell colors, falling cells in the top padding and a key per side panel.
+        self.drawn_cells = None
+        self.drawn_above = {}
+        self.drawn_panels = {}
+        super().__init__(training_mode, mirror_mode, table, seed, recorder, weights, auto_restart, surfaces)
 
     def reset(self):
+        super().reset()
         self.clock = pygame.time.Clock()
         self.fall_time = 0
-        self.fall_speed = 500
-        self.locked_positions = {}
-        self.score = 0
-        self.total_lines_cleared = 0
         self.is_paused = False
-        self.level = 1
-        self.falling = None if self.mirror_mode else Tetromino(GRID_WIDTH // 2 - 2, -1)
-        self.next_tetrominos = [] if self.mirror_mode else self.get_next_tetrominos(5)
-        self.held = None
         self.update_grid()
 
-        # Useful for training
-        self.holes = 0
-        self.bumpiness = 0
-
     def update_grid(self):
-        self.grid = [[self.locked_positions.get((x, y), BLACK) for x in range(GRID_WIDTH)] for y in range(GRID_HEIGHT)]
+        colors = self.board.colors
+        self.grid = [[color or BLACK for color in row] for row in colors]
+
+    def cell_sprite(self, color):
+        sprite = self.cell_sprites.get(color)
+        if sprite is None:
+            sprite = pygame.Surface((GRID_SIZE, GRID_SIZE)).convert()
+            sprite.fill(color)
+            pygame.draw.rect(sprite, GRAY, sprite.get_rect(), 1)
+            self.cell_sprites[color] = sprite
+        return sprite
+
+    def render_text(self, text):
+        surface = self.text_surfaces.get(text)
+        if surface is None:
+            # Scores keep changing, so don't let the cache grow forever.
+            if len(self.text_surfaces) >= TEXT_CACHE_SIZE:
+                self.text_surfaces.clear()
+            surface = self.font.render(text, True, WHITE)
+            self.text_surfaces[text] = surface
+        return surface
+
+    def draw_cell(self, left, top, color):
+        self.screen.blit(self.cell_sprite(color), (left, top))
 
     def draw_grid(self):
         for y in range(GRID_HEIGHT):
             for x in range(GRID_WIDTH):
-                self.draw_rect(
-                    (LEFT_SIDEBAR_WIDTH + x * GRID_SIZE, TOP_PADDING + y * GRID_SIZE, GRID_SIZE, GRID_SIZE),
-                    self.grid[y][x],
-                    GRAY,
-                )
+                self.draw_cell(LEFT_SIDEBAR_WIDTH + x * GRID_SIZE, TOP_PADDING + y * GRID_SIZE, self.grid[y][x])
 
     def draw_falling(self):
         if self.falling:
             for x, y in self.falling.enumerate_cells():
-                self.draw_rect(
-                    (
-                        LEFT_SIDEBAR_WIDTH + (self.falling.x + x) * GRID_SIZE,
-                        TOP_PADDING + (self.falling.y + y) * GRID_SIZE,
-                        GRID_SIZE,
-                        GRID_SIZE,
-                    ),
+                self.draw_cell(
+                    LEFT_SIDEBAR_WIDTH + (self.falling.x + x) * GRID_SIZE,
+                    TOP_PADDING + (self.falling.y + y) * GRID_SIZE,
                     self.falling.shape.color,
-                    GRAY,
                 )
 
     def draw_held(self):
         if self.held:
             for x, y in self.held.enumerate_cells():
-                self.draw_rect(
-                    (
-                        50 + x * GRID_SIZE,
-                        50 + y * GRID_SIZE,
-                        GRID_SIZE,
-                        GRID_SIZE,
-                    ),
-                    self.held.shape.color,
-                    GRAY,
-                )
-
-    def valid_move(self):
-        for x, y in self.falling.enumerate_cells():
-            if (
-                self.falling.x + x < 0
-                or self.falling.x + x >= GRID_WIDTH
-                or self.falling.y + y >= GRID_HEIGHT
-                or self.grid[self.falling.y + y][self.falling.x + x] != BLACK
-            ):
-                return False
-
-        return True
-
-    def clear_lines(self):
-        lines_cleared = 0
-        # To do: opportunity to shortcut.
-        for y in reversed(range(GRID_HEIGHT)):
-            if all((x, y) in self.locked_positions for x in range(GRID_WIDTH)):
-                for x in range(GRID_WIDTH):
-                    del self.locked_positions[(x, y)]
-                lines_cleared += 1
-            elif lines_cleared > 0:
-                for x in range(GRID_WIDTH):
-                    if (x, y) not in self.locked_positions:
-                        continue
-                    value = self.locked_positions.pop((x, y))
-                    self.locked_positions[(x, y + lines_cleared)] = value
-
-        return lines_cleared
+                self.draw_cell(50 + x * GRID_SIZE, 50 + y * GRID_SIZE, self.held.shape.color)
 
     def complete_fall(self):
-        for x, y in self.falling.enumerate_cells():
-            self.locked_positions[(self.falling.x + x, self.falling.y + y)] = self.falling.shape.color
-
-        lines_cleared = self.clear_lines()
-        score_earned = SCORE_FACTORS[lines_cleared] * self.level
-        self.score += score_earned
-
-        self.total_lines_cleared += lines_cleared
-        # Increase level/speed.
-        self.level = 1 if self.training_mode else self.total_lines_cleared // LINES_PER_LEVEL + 1
-
+        super().complete_fall()
+        self.pieces_placed += 1
         self.update_grid()
-        self.rotate_upcoming()
-
-        orig_holes = self.holes
-        orig_bumpiness = self.bumpiness
-        self.count_holes()
-        self.calculate_bumpiness()
-        increased_holes = self.holes - orig_holes
-        increased_bumpiness = self.bumpiness - orig_bumpiness
-        self.reward = score_earned - (increased_holes * 2) - (increased_bumpiness - 3)
-        # print(f"{self.reward}: bumpiness {orig_bumpiness} -> {self.bumpiness}")
-
-        self.fall_speed = 500 / (1 + (self.level - 1) * 0.2)
-
-        if not self.valid_move():
-            self.update_records_and_restart()
-        # print(f"Holes: {self.count_holes()}")
-        # print(f"Bumpiness: {self.calculate_bumpiness()}")
-
-    def get_next_tetrominos(self, num):
-        return [Tetromino(GRID_WIDTH // 2 - 2, 0) for _ in range(num)]
-
-    def rotate_upcoming(self):
-        self.falling = self.next_tetrominos.pop(0)
-        self.next_tetrominos.extend(self.get_next_tetrominos(1))
 
     def draw_rect(self, rect, color, border_color):
         pygame.draw.rect(self.screen, color, rect, 0)
@@ -192,23 +158,17 @@ class TetrisGame:
     def draw_preview(self):
         for i, tetromino in enumerate(self.next_tetrominos):
             for x, y in tetromino.enumerate_cells():
-                self.draw_rect(
-                    (
-                        LEFT_SIDEBAR_WIDTH + GRID_WIDTH * GRID_SIZE + PREVIEW_OFFSET_X + x * GRID_SIZE,
-                        PREVIEW_OFFSET_Y + i * GRID_SIZE * PREVIEW_HEIGHT + y * GRID_SIZE,
-                        GRID_SIZE,
-                        GRID_SIZE,
-                    ),
+                self.draw_cell(
+                    LEFT_SIDEBAR_WIDTH + GRID_WIDTH * GRID_SIZE + PREVIEW_OFFSET_X + x * GRID_SIZE,
+                    PREVIEW_OFFSET_Y + i * GRID_SIZE * PREVIEW_HEIGHT + y * GRID_SIZE,
                     tetromino.shape.color,
-                    GRAY,
                 )
 
     def draw_pause_button(self):
         button_color = RED if self.is_paused else GREEN
         pygame.draw.rect(self.screen, button_color, (PAUSE_OFFSET_X, PAUSE_OFFSET_Y, PAUSE_WIDTH, PAUSE_HEIGHT), 0)
         pygame.draw.rect(self.screen, WHITE, (PAUSE_OFFSET_X, PAUSE_OFFSET_Y, PAUSE_WIDTH, PAUSE_HEIGHT), 1)
-        font = pygame.font.Font(None, 24)
-        text = font.render("Pause" if not self.is_paused else "Resume", True, WHITE)
+        text = self.render_text("Pause" if not self.is_paused else "Resume")
         self.screen.blit(text, (PAUSE_OFFSET_X + 20, PAUSE_OFFSET_Y + 10))
 
     def is_pause_button_clicked(self, pos):
@@ -218,71 +178,118 @@ class TetrisGame:
         )
 
     def draw_stat(self, text, y):
-        font = pygame.font.Font(None, 24)
-        text = font.render(text, True, WHITE)
-        self.screen.blit(text, (20, y))
+        self.screen.blit(self.render_text(text), (20, y))
+
+    def stat_lines(self):
+        return (
+            (f"Level: {self.level}", 50),
+            (f"Lines: {self.total_lines_cleared}", 100),
+            (f"Score: {self.score}", 150),
+            (f"Interval: {self.fall_speed:.0f}", 200),
+            ("RECORDS", 450),
+            (f"Rounds: {self.rounds}", 500),
+            (f"Level: {self.record_level}", 550),
+            (f"Lines: {self.record_lines}", 600),
+            (f"Score: {self.record_score}", 650),
+        )
 
-    def update_records_and_restart(self):
-        self.rounds += 1
-        self.record_level = max(self.record_level, self.level)
-        self.record_lines = max(self.record_lines, self.total_lines_cleared)
-        self.record_score = max(self.record_score, self.score)
-        self.reset()
+    def draw_sidebar(self):
+        if self.mirror_mode:
+            self.draw_held()
+        else:
+            self.draw_pause_button()
+            for text, y in self.stat_lines():
+                self.draw_stat(text, y)
 
     def update_screen(self):
+        if self.dirty_rects and self.drawn_cells is not None:
+            self.update_changed()
+            return
         self.screen.fill(BLACK)
         self.draw_grid()
         self.draw_falling()
         self.draw_preview()
-        if self.mirror_mode:
-            self.draw_held()
-        else:
-            self.draw_pause_button()
-            self.draw_stat(f"Level: {self.level}", 50)
-            self.draw_stat(f"Lines: {self.total_lines_cleared}", 100)
-            self.draw_stat(f"Score: {self.score}", 150)
-            self.draw_stat(f"Interval: {self.fall_speed:.0f}", 200)
-            self.draw_stat("RECORDS", 450)
-            self.draw_stat(f"Rounds: {self.rounds}", 500)
-            self.draw_stat(f"Level: {self.record_level}", 550)
-            self.draw_stat(f"Lines: {self.record_lines}", 600)
-            self.draw_stat(f"Score: {self.record_score}", 650)
+        self.draw_sidebar()
         pygame.display.update()
-
-    def move_h(self, direction):
-        self.falling.x += direction
-        if not self.valid_move():
-            self.falling.x -= direction
-
-    def count_holes(self):
-        num_holes = 0
-        for x in range(GRID_WIDTH):
-            found_locked_pos = False
-            for y in range(GRID_HEIGHT):
-                if (x, y) in self.locked_positions:
-                    found_locked_pos = True
-                elif found_locked_pos:
-                    num_holes += 1
-        self.holes = num_holes
-        return num_holes
-
-    def calculate_bumpiness(self):
-        bumpiness = 0
-        column_heights = []
-
-        for x in range(GRID_WIDTH):
-            height = 0
-            for y in range(GRID_HEIGHT):
-                if (x, y) in self.locked_positions:
-                    height = GRID_HEIGHT - y
-                    break
-            column_heights.append(height)
-
-        for i in range(1, len(column_heights)):
-            bumpiness += abs(column_heights[i] - column_heights[i - 1])
-
-        self.bumpiness = bumpiness
-        return bumpiness
+        if self.dirty_rects:
+            self.drawn_cells = self.visible_cells()
+            self.drawn_above = self.cells_above()
+            self.drawn_panels = self.panel_keys()
+
+    def visible_cells(self):
+        # Board colors with the falling piece on top.
+        cells = [list(row) for row in self.grid]
+        if self.falling:
+            for x, y in self.falling.enumerate_cells():
+                x += self.falling.x
+                y += self.falling.y
+                if 0 <= y < GRID_HEIGHT and 0 <= x < GRID_WIDTH:
+                    cells[y][x] = self.falling.shape.color
+        return cells
+
+    def cells_above(self):
+        # Falling cells above the grid, which draw_falling puts in the top padding: {(x, y): color}.
+        cells = {}
+        if self.falling:
+            for x, y in self.falling.enumerate_cells():
+                if self.falling.y + y < 0:
+                    cells[(self.falling.x + x, self.falling.y + y)] = self.falling.shape.color
+        return cells
+
+    def panel_keys(self):
+        held = self.held.shape.index if self.held else None
+        return {
+            "preview": tuple(tetromino.shape.index for tetromino in self.next_tetrominos),
+            "sidebar": (held, self.is_paused) if self.mirror_mode else (self.is_paused, self.stat_lines()),
+        }
+
+    def update_changed(self):
+        dirty = []
+        cells = self.visible_cells()
+        for y, (row, drawn_row) in enumerate(zip(cells, self.drawn_cells)):
+            for x, (color, drawn) in enumerate(zip(row, drawn_row)):
+                if color != drawn:
+                    left, top = LEFT_SIDEBAR_WIDTH + x * GRID_SIZE, TOP_PADDING + y * GRID_SIZE
+                    self.draw_cell(left, top, color)
+                    dirty.append((left, top, GRID_SIZE, GRID_SIZE))
+        self.drawn_cells = cells
+
+        # The padding has no board cells underneath, so cells the piece left are cleared to the background.
+        above = self.cells_above()
+        for (x, y), drawn in self.drawn_above.items():
+            if (x, y) not in above:
+                rect = (LEFT_SIDEBAR_WIDTH + x * GRID_SIZE, TOP_PADDING + y * GRID_SIZE, GRID_SIZE, GRID_SIZE)
+                self.screen.fill(BLACK, rect)
+                dirty.append(rect)
+        for (x, y), color in above.items():
+            if self.drawn_above.get((x, y)) != color:
+                left, top = LEFT_SIDEBAR_WIDTH + x * GRID_SIZE, TOP_PADDING + y * GRID_SIZE
+                self.draw_cell(left, top, color)
+                dirty.append((left, top, GRID_SIZE, GRID_SIZE))
+        self.drawn_above = above
+
+        panels = self.panel_keys()
+        for name, draw in (("preview", self.draw_preview), ("sidebar", self.draw_sidebar)):
+            if panels[name] != self.drawn_panels.get(name):
+                rect = PANEL_RECTS[name]
+                self.screen.fill(BLACK, rect)
+                draw()
+                dirty.append(rect)
+        self.drawn_panels = panels
+
+        if dirty:
+            pygame.display.update(dirty)
+
+    def render_due(self):
+        # Applies the every-N-pieces and frame rate limits.
+        if self.render_every and self.pieces_placed - self.last_render_piece < self.render_every:
+            return False
+        now = time.perf_counter()
+        if self.render_fps and now - self.last_render_time < 1 / self.render_fps:
+            return False
+        self.last_render_piece = self.pieces_placed
+        self.last_render_time = now
+        return True
 
     def run(self):
         while True:
@@ -304,145 +311,33 @@ class TetrisGame:
                     if event.key == pygame.K_RIGHT:
                         self.move_h(1)
                     if event.key == pygame.K_DOWN:
-                        self.falling.y += 1
-                        if not self.valid_move():
-                            self.falling.y -= 1
+                        self.move_down()
                     if event.key == pygame.K_SPACE:
                         space_pressed = True
-                        while self.valid_move():
-                            self.falling.y += 1
-                        self.falling.y -= 1
-                        self.complete_fall()
+                        self.hard_drop()
                     if event.key == pygame.K_UP:
-                        self.falling.rotate()
-                        if not self.valid_move():
-                            self.falling.unrotate()
+                        self.rotate()
 
             # Tetromino falling
             if self.fall_time > self.fall_speed and not self.is_paused and not space_pressed:
                 self.fall_time = 0
-                self.falling.y += 1
-                if not self.valid_move():
-                    self.falling.y -= 1
+                if not self.move_down():
                     self.complete_fall()
 
             # Drawing
-            self.update_screen()
+            if self.render_due():
+                self.update_screen()
 
-    def is_valid_position(self, tetromino: Tetromino):
-        for x, y in tetromino.enumerate_cells():
-            if (
-                tetromino.x + x < 0
-                or tetromino.x + x >= GRID_WIDTH
-                or tetromino.y + y >= GRID_HEIGHT
-                or (tetromino.x + x, tetromino.y + y) in self.locked_positions
-            ):
-                return False
-
-        return True
+    def step(self, rotate, column, hold=False, delay=1):
+        super().step(rotate, column, hold)
 
-    def estimate_cost(self, tetromino: Tetromino):
-        # print(tetromino.x, tetromino.y, tetromino.shape.rotations)
-        locked_positions = dict(self.locked_positions)
-        for x, y in tetromino.enumerate_cells():
-            locked_positions[(tetromino.x + x, tetromino.y + y)] = tetromino.shape.color
-        # print(locked_positions)
-
-        # Try to clear lines first.
-        lines_cleared = 0
-        for y in reversed(range(GRID_HEIGHT)):
-            if all((x, y) in locked_positions for x in range(GRID_WIDTH)):
-                for x in range(GRID_WIDTH):
-                    del locked_positions[(x, y)]
-                lines_cleared += 1
-            elif lines_cleared > 0:
-                for x in range(GRID_WIDTH):
-                    if (x, y) not in locked_positions:
-                        continue
-                    value = locked_positions.pop((x, y))
-                    locked_positions[(x, y + lines_cleared)] = value
-
-        num_holes = 0
-        bumpiness = 0
-        column_heights = []
-        for x in range(GRID_WIDTH):
-            found_locked_pos = False
-            for y in range(GRID_HEIGHT):
-                if (x, y) in locked_positions:
-                    if not found_locked_pos:
-                        found_locked_pos = True
-                        column_heights.append(GRID_HEIGHT - y)
-                elif found_locked_pos:
-                    num_holes += 1
-            if not found_locked_pos:
-                column_heights.append(0)
-
-        for i in range(1, len(column_heights)):
-            bumpiness += abs(column_heights[i] - column_heights[i - 1])
-        total_height = sum(column_heights)
-        cost = total_height + bumpiness * 2 + num_holes * 20
-        return cost
-
-    def get_best_action(self):
-        if not self.falling:
-            print("not falling...")
-            return 0, 0
-
-        min_cost = 10000
-        best_r, best_x = 0, 0
-        # Check each rotation.
-        for r in range(self.falling.shape.num_rotations()):
-            # Make a copy.
-            tetromino = self.falling.rotated_copy(r)
-            initial_y = tetromino.y
-            # Try from left to right.
-            for x in range(-tetromino.rotation_info.left, GRID_WIDTH - tetromino.rotation_info.right):
-                tetromino.x = x
-                tetromino.y = initial_y
-
-                while self.is_valid_position(tetromino):
-                    tetromino.y += 1
-                tetromino.y -= 1
-
-                cost = self.estimate_cost(tetromino)
-                print(r, x, cost)
-                if cost < min_cost:
-                    min_cost = cost
-                    best_r, best_x = r, x
-        return best_r, best_x
-
-    def step(self, rotate, column, delay=1):
-        orig_score, orig_holes, orig_bumpiness = self.score, self.holes, self.bumpiness
-
-        # Rotate.
-        for _ in range(rotate):
-            self.falling.rotate()
-
-        # Move.
-        movement = column - 3
-        if movement != 0:
-            distance = abs(movement)
-            direction = movement // distance
-            for _ in range(distance):
-                self.move_h(direction)
-
-        # Fall.
-        while self.valid_move():
-            self.falling.y += 1
-        self.falling.y -= 1
-        self.complete_fall()
-
-        self.count_holes()
-        self.calculate_bumpiness()
-
-        # Calculate reward
-        # Consider game reset
-
-        if delay:
+        # With render_every set, pieces between frames are played without drawing or waiting.
+        if (delay or self.render_every) and self.render_due():
             for event in pygame.event.get():
                 pass
             self.update_screen()
-            time.sleep(delay)
+            if delay:
+                time.sleep(delay)
 
 
 if __name__ == "__main__":
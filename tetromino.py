@@ -1,4 +1,7 @@
 import random
+from array import array
+
+from board import GRID_WIDTH
 
 # fmt: off
 # Tetromino shapes
@@ -82,28 +85,50 @@ SHAPE_VISUALS = [
 ]
 # fmt: on
 
+SPAWN_X = GRID_WIDTH // 2 - 2
+
 COLORS = [(192, 73, 188), (170, 105, 62), (77, 64, 159), (177, 156, 70), (173, 225, 81), (167, 63, 64), (93, 178, 135)]
 
 
+# One interned, read-only record per (shape, rotation), shared by every piece and search node.
 class RotationInfo:
+    __slots__ = ("matrix", "cells", "left", "right", "width", "row_masks", "min_x", "max_x", "column_profile")
+
     def __init__(self, visual):
-        self.matrix = [[c == "O" for c in row] for row in visual]
-        left, right = 3, 0
-        for row in self.matrix:
-            for x, filled in enumerate(row):
-                if not filled:
-                    continue
-                left = min(left, x)
-                right = max(right, x)
-        self.left = left
-        self.right = right
+        self.matrix = tuple(tuple(c == "O" for c in row) for row in visual)
+        # (x, y) of each filled cell within the 4x4 matrix.
+        self.cells = tuple((x, y) for y, row in enumerate(self.matrix) for x, filled in enumerate(row) if filled)
+        self.left = min(x for x, _ in self.cells)
+        self.right = max(x for x, _ in self.cells)
+        self.width = self.right - self.left + 1
+        # Bitmask per non-empty row, shifted so that the leftmost cell is bit 0.
+        row_masks = []
+        for y, row in enumerate(self.matrix):
+            mask = sum(1 << (x - self.left) for x, filled in enumerate(row) if filled)
+            if mask:
+                row_masks.append((y, mask))
+        self.row_masks = tuple(row_masks)
+        # Valid x-range and the (column offset, lowest row, highest row) of each filled column.
+        self.min_x = -self.left
+        self.max_x = GRID_WIDTH - 1 - self.right
+        column_profile = []
+        for x in range(self.left, self.right + 1):
+            ys = [y for y, row in enumerate(self.matrix) if row[x]]
+            column_profile.append((x - self.left, max(ys), min(ys)))
+        self.column_profile = tuple(column_profile)
 
 
 class Shape:
+    __slots__ = ("rotations", "color", "index", "drops")
+
     def __init__(self, variants, color, index):
-        self.rotations = [RotationInfo(v) for v in variants]
+        self.rotations = tuple(RotationInfo(v) for v in variants)
         self.color = color
         self.index = index
+        # Every (rotation, rotation info, x) a straight drop can use, in rotation then column order.
+        self.drops = tuple(
+            (r, info, x) for r, info in enumerate(self.rotations) for x in range(info.min_x, info.max_x + 1)
+        )
 
     def num_rotations(self):
         return len(self.rotations)
@@ -112,29 +137,62 @@ class Shape:
 SHAPES = [Shape(variants, color, i) for i, (variants, color) in enumerate(zip(SHAPE_VISUALS, COLORS))]
 
 
+PRECOMPUTED_BAGS = 256
+
+
 # 7-bag - https://simon.lc/the-history-of-tetris-randomizers
 class Shape7Bag:
-    def __init__(self) -> None:
-        self.bag: Shape = []
+    def __init__(self, seed=None) -> None:
+        # Each bag owns its generator, so games with the same seed get the same pieces.
+        self.random = random.Random(seed)
+        self.sequence = array("B")
+        self.position = 0
+        # Pieces handed out so far; drawn % 7 is the position inside the current bag.
+        self.drawn = 0
+
+    def refill(self, num_bags=PRECOMPUTED_BAGS):
+        del self.sequence[: self.position]
+        self.position = 0
+        for _ in range(num_bags):
+            bag = list(range(len(SHAPES)))
+            self.random.shuffle(bag)
+            self.sequence.extend(bag)
+
+    def generate(self, num):
+        # Shape indexes of the next num pieces, in bulk.
+        if len(self.sequence) - self.position < num:
+            self.refill(max(PRECOMPUTED_BAGS, -(-num // len(SHAPES))))
+        indexes = self.sequence[self.position : self.position + num]
+        self.position += num
+        self.drawn += num
+        return indexes
 
     def next(self):
-        if not self.bag:
-            self.bag = list(SHAPES)
-            random.shuffle(self.bag)
-
-        return self.bag.pop(0)
+        if self.position >= len(self.sequence):
+            self.refill()
+        shape = SHAPES[self.sequence[self.position]]
+        self.position += 1
+        self.drawn += 1
+        return shape
 
 
+# Fallback for Tetromino() without a shape. Games draw from their own bag instead.
 RANDOM_BAG = Shape7Bag()
 
 
 class Tetromino:
+    __slots__ = ("x", "y", "shape", "rotation", "rotation_info")
+
     def __init__(self, x, y, shape=None, rotation=0):
+        self.respawn(x, y, shape if shape else RANDOM_BAG.next(), rotation)
+
+    def respawn(self, x, y, shape, rotation=0):
+        # Reuses this object for another piece.
         self.x = x
         self.y = y
-        self.shape = shape if shape else RANDOM_BAG.next()
+        self.shape = shape
         self.rotation = rotation
-        self.rotation_info = self.shape.rotations[self.rotation]
+        self.rotation_info = shape.rotations[rotation]
 
     def rotate(self):
         self.rotation = (self.rotation + 1) % self.shape.num_rotations()
@@ -145,10 +203,7 @@ class Tetromino:
         self.rotation_info = self.shape.rotations[self.rotation]
 
     def enumerate_cells(self):
-        for y, row in enumerate(self.rotation_info.matrix):
-            for x, cell in enumerate(row):
-                if cell:
-                    yield x, y
+        return self.rotation_info.cells
 
     def rotated_copy(self, rotation):
         return Tetromino(self.x, self.y, self.shape, rotation)
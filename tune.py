@@ -0,0 +1,174 @@
+# Cross-entropy tuning of the cost weights over seeded headless games.
+#
+#   python tune.py --checkpoint tune.json                  # resumes automatically if tune.json exists
+#   python tune.py --features aggregate_height,holes,bumpiness --generations 20
+#
+# Every candidate of a generation plays the same seeds, so scores differ by weights rather than by luck.
+# The result can be replayed with: python selfplay.py --weights "<printed weights>"
+#
+# Fitness is the mean game score, not lines cleared. Under the piece cap every surviving candidate clears about
+# pieces * 4 / 10 lines, so lines saturate and the elite would be picked by leftover cells. Score keeps rising
+# with multi-line clears (and with the level they reach), and games that top out early score less.
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+from board import BoardStats
+from search import DEFAULT_BEAM_WIDTH, DEFAULT_WEIGHTS
+from selfplay import GAMES_PER_TASK, play_games
+
+DEFAULT_CHECKPOINT = "tune_checkpoint.json"
+# Stored in checkpoints, so a run isn't resumed with scores measured differently.
+OBJECTIVE = "score"
+INITIAL_STD = 5.0
+ELITE_FRACTION = 0.2
+
+
+def to_weights(features, vector):
+    weights = dict.fromkeys(BoardStats._fields, 0)
+    weights.update(zip(features, vector))
+    return BoardStats(**weights)
+
+
+def format_weights(weights):
+    return ",".join(f"{feature}={weight:.3f}" for feature, weight in weights._asdict().items() if weight)
+
+
+def initial_state(features, seed):
+    defaults = DEFAULT_WEIGHTS._asdict()
+    return {
+        "features": features,
+        "objective": OBJECTIVE,
+        "seed": seed,
+        "generation": 0,
+        "mean": [float(defaults[feature]) for feature in features],
+        "std": [INITIAL_STD] * len(features),
+        "best": None,
+        # Generations in a row without a better best candidate.
+        "stale": 0,
+        "history": [],
+    }
+
+
+def save_checkpoint(state, path):
+    # Write then rename, so an interrupted run never leaves a truncated checkpoint.
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def evaluate(executor, population, seeds, pieces_per_game):
+    # Mean game score per candidate. All games of all candidates are queued at once.
+    chunks = [seeds[i : i + GAMES_PER_TASK] for i in range(0, len(seeds), GAMES_PER_TASK)]
+    futures = [
+        [executor.submit(play_games, chunk, pieces_per_game, 1, DEFAULT_BEAM_WIDTH, weights) for chunk in chunks]
+        for weights in population
+    ]
+    scores = []
+    for candidate_futures in futures:
+        results = [result for future in candidate_futures for result in future.result()]
+        scores.append(sum(result["score"] for result in results) / len(results))
+    return scores
+
+
+def tune(state, args, checkpoint=None):
+    features = state["features"]
+    num_elite = max(2, round(args.population * ELITE_FRACTION))
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        while state["generation"] < args.generations:
+            generation = state["generation"]
+            rng = random.Random(f"{state['seed']}:{generation}")
+            population = [
+                [rng.gauss(mean, std) for mean, std in zip(state["mean"], state["std"])] for _ in range(args.population)
+            ]
+            first_seed = state["seed"] + generation * args.games
+            seeds = list(range(first_seed, first_seed + args.games))
+
+            start = time.perf_counter()
+            scores = evaluate(executor, [to_weights(features, vector) for vector in population], seeds, args.pieces)
+            ranked = sorted(zip(scores, population), key=itemgetter(0), reverse=True)
+
+            # Refit to the elite. Extra noise, shrinking over time, keeps the search from collapsing too early.
+            elite = [vector for _, vector in ranked[:num_elite]]
+            noise = args.noise / (generation + 1)
+            state["mean"] = [statistics.fmean(values) for values in zip(*elite)]
+            state["std"] = [statistics.pstdev(values) + noise for values in zip(*elite)]
+
+            best_score, best_vector = ranked[0]
+            if state["best"] is None or best_score > state["best"]["score"]:
+                state["best"] = {"score": best_score, "weights": best_vector, "generation": generation}
+                state["stale"] = 0
+            else:
+                state["stale"] += 1
+            state["history"].append(
+                {
+                    "generation": generation,
+                    "best": best_score,
+                    "elite_mean": statistics.fmean(score for score, _ in ranked[:num_elite]),
+                    "population_mean": statistics.fmean(scores),
+                    "duration": time.perf_counter() - start,
+                }
+            )
+            state["generation"] += 1
+            if checkpoint:
+                save_checkpoint(state, checkpoint)
+
+            summary = state["history"][-1]
+            print(
+                f"Generation {generation}: best {best_score:.1f}, elite {summary['elite_mean']:.1f}, "
+                f"mean weights {format_weights(to_weights(features, state['mean']))} ({summary['duration']:.1f}s)"
+            )
+
+            # Early termination.
+            if max(state["std"]) < args.min_std:
+                print(f"Converged: every weight's std is below {args.min_std}")
+                break
+            if state["stale"] >= args.patience:
+                print(f"Stopping: no better candidate in {args.patience} generations")
+                break
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune cost weights with the cross-entropy method.")
+    parser.add_argument("--features", default=",".join(BoardStats._fields), help="comma-separated BoardStats fields")
+    parser.add_argument("--generations", type=int, default=30)
+    parser.add_argument("--population", type=int, default=24, help="candidates per generation")
+    parser.add_argument("--games", type=int, default=8, help="games per candidate")
+    parser.add_argument("--pieces", type=int, default=500, help="piece limit per game")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of CPUs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=1.0, help="extra std, divided by generation + 1")
+    parser.add_argument("--min-std", type=float, default=0.05, help="stop once every weight's std is below this")
+    parser.add_argument("--patience", type=int, default=8, help="stop after this many generations without progress")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="state file, resumed from if it exists")
+    args = parser.parse_args()
+
+    if os.path.exists(args.checkpoint):
+        with open(args.checkpoint) as f:
+            state = json.load(f)
+        if state.get("objective") != OBJECTIVE:
+            parser.error(f"{args.checkpoint} was tuned for a different objective; pass a new --checkpoint")
+        print(f"Resuming {args.checkpoint} at generation {state['generation']}")
+    else:
+        features = [feature.strip() for feature in args.features.split(",")]
+        unknown = set(features) - set(BoardStats._fields)
+        if unknown:
+            parser.error(f"unknown features: {', '.join(sorted(unknown))}")
+        state = initial_state(features, args.seed)
+
+    state = tune(state, args, args.checkpoint)
+    if state["best"] is not None:
+        best = to_weights(state["features"], state["best"]["weights"])
+        print(f"Best: {format_weights(best)} (score {state['best']['score']:.1f})")
+    print(f"Mean: {format_weights(to_weights(state['features'], state['mean']))}")
+
+
+if __name__ == "__main__":
+    main()